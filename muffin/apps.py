@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MuffinConfig(AppConfig):
     name = 'muffin'
+
+    def ready(self):
+        from .controllers import ensure_search_triggers
+
+        post_migrate.connect(ensure_search_triggers, sender=self)
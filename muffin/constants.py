@@ -1,4 +1,71 @@
+from datetime import timedelta
+from pathlib import Path
+
 AVERAGE_WPM = 250
 PAGE_SIZE = 50
+ARTICLE_DATE_FORMATS = {
+    "today": "Today, %H:%M",
+    "yesterday": "Yesterday, %H:%M",
+    "this_year": "%b. %d, %H:%M",
+    "older": "%b. %d, %Y, %H:%M",
+}
+ARTICLE_ROW_CACHE_TTL = 60 * 60
 QUOTE_API_BASE_URL = "https://api.quotable.io"
+# Quotes shipped with the app, used until refresh_quotes has filled the cache
+QUOTE_CORPUS_PATH = Path(__file__).resolve().parent / "data" / "quotes.json"
+QUOTE_CACHE_KEY = "quotes"
+QUOTE_CACHE_TTL = 7 * 24 * 60 * 60
+QUOTE_INDEX_RELOAD_INTERVAL = 60 * 60
+# Long enough for the reading speed test to mean something
+QUOTE_MIN_LENGTH = 250
 FAVICON_API_BASE_URL = "https://www.google.com/s2/favicons"
+POLL_MAX_WORKERS = 16
+POLL_MAX_PER_HOST = 2
+# Due feeds held back while their host has POLL_MAX_PER_HOST fetches running,
+# so the other workers can move on to feeds further down the queue
+POLL_MAX_WAITING = 500
+POLL_CHUNK_SIZE = 500
+# Seconds a poll started from the web may spend starting fetches
+POLL_TRIGGER_MAX_DURATION = 20
+SCRAPE_MAX_ATTEMPTS = 5
+SCRAPE_RETRY_DELAY = timedelta(minutes=5)
+SCRAPE_LEASE = timedelta(minutes=10)
+SCRAPE_BATCH_SIZE = 100
+SCRAPE_CACHE_TTL = timedelta(days=7)
+# Query parameters dropped from urls before looking up the scrape cache
+TRACKING_PARAM_PREFIXES = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "_ga")
+MIN_POLL_INTERVAL = timedelta(minutes=5)
+MAX_POLL_INTERVAL = timedelta(days=1)
+POLL_BACKOFF_FACTOR = 2
+POLL_CADENCE_SAMPLE_SIZE = 10
+HTTP_USER_AGENT = "muffin (+https://app.erich.elendt.com/muffin)"
+# (connect, read) seconds
+HTTP_TIMEOUT = (5, 30)
+HTTP_MAX_RESPONSE_BYTES = 10 * 2**20
+HTTP_MAX_PER_HOST = POLL_MAX_PER_HOST
+HTTP_MAX_HOSTS = 100
+TIMELINE_BATCH_SIZE = 500
+TIMELINE_VERSION_KEY = "timeline_version"
+# Cache alias for rendered pages and fragments, see CACHES in app/settings.py
+PAGE_CACHE_ALIAS = "pages"
+ANONYMOUS_INDEX_CACHE_TTL = 60 * 60
+# How long a front proxy may serve the logged out index without asking again
+ANONYMOUS_INDEX_MAX_AGE = 60
+SEARCH_RESULT_LIMIT = 50
+# How many of the newest matches a search ranks
+SEARCH_CANDIDATE_LIMIT = 1000
+# The columns each FTS table indexes, as created by migration 0018_search_index
+SEARCH_INDEXED_COLUMNS = {
+    "muffin_feed": ("title", "description"),
+    "muffin_article": ("title",),
+}
+# Most reads the page script may send in one batch
+READ_BATCH_MAX_SIZE = 500
+# The page script sends its reads within seconds,
+# read times further back than this are pulled up to it
+READ_BATCH_MAX_AGE = timedelta(days=1)
+# Days of history the stats page offers besides all of it
+STATS_WINDOW_CHOICES = (7, 30, 90, 365)
+ROLLUP_BATCH_SIZE = 500
+# Read events fetched and written per step of a data export
+EXPORT_CHUNK_SIZE = 2000
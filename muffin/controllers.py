@@ -1,26 +1,186 @@
+import base64
+import binascii
+import bisect
+import functools
+import itertools
+import json
 import logging
 import math
-import operator
 import random
+import re
+import threading
 import time
 import urllib
-from datetime import datetime, timedelta
-from typing import Optional
-from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
+from collections import Counter, defaultdict, deque
 
-import feedfinder2
 import feedparser
-import plotly
-import plotly.express as px
-import requests
+from django.core.cache import cache
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Count, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.core.serializers.json import DjangoJSONEncoder
 from django.forms.models import model_to_dict
 from django.utils import timezone
-from newspaper import Article as ScrapedArticle
-from newspaper import ArticleException as ScrapedArticleException
-from newspaper.configuration import Configuration as ScraperConfigBase
 
-from .constants import AVERAGE_WPM, FAVICON_API_BASE_URL, QUOTE_API_BASE_URL
-from .models import Article, Feed, ReadEvent, User
+from .constants import (
+    ARTICLE_DATE_FORMATS,
+    AVERAGE_WPM,
+    EXPORT_CHUNK_SIZE,
+    FAVICON_API_BASE_URL,
+    HTTP_MAX_HOSTS,
+    HTTP_MAX_PER_HOST,
+    HTTP_MAX_RESPONSE_BYTES,
+    HTTP_TIMEOUT,
+    HTTP_USER_AGENT,
+    MAX_POLL_INTERVAL,
+    MIN_POLL_INTERVAL,
+    PAGE_SIZE,
+    POLL_BACKOFF_FACTOR,
+    POLL_CADENCE_SAMPLE_SIZE,
+    POLL_CHUNK_SIZE,
+    POLL_MAX_PER_HOST,
+    POLL_MAX_WAITING,
+    POLL_MAX_WORKERS,
+    QUOTE_API_BASE_URL,
+    QUOTE_CACHE_KEY,
+    QUOTE_CACHE_TTL,
+    QUOTE_CORPUS_PATH,
+    QUOTE_INDEX_RELOAD_INTERVAL,
+    QUOTE_MIN_LENGTH,
+    ROLLUP_BATCH_SIZE,
+    TRACKING_PARAM_PREFIXES,
+    SCRAPE_CACHE_TTL,
+    SCRAPE_LEASE,
+    SCRAPE_MAX_ATTEMPTS,
+    SCRAPE_RETRY_DELAY,
+    SEARCH_CANDIDATE_LIMIT,
+    SEARCH_INDEXED_COLUMNS,
+    SEARCH_RESULT_LIMIT,
+    TIMELINE_BATCH_SIZE,
+    TIMELINE_VERSION_KEY,
+)
+from .models import (
+    Article,
+    Feed,
+    ReadEvent,
+    ReadingRollup,
+    ScrapeJob,
+    ScrapeResult,
+    TimelineEntry,
+    User,
+)
+
+# requests, feedfinder2 and newspaper are imported by the functions that use them,
+# so web workers and commands that never fetch or scrape don't pay for loading them
+if TYPE_CHECKING:
+    import requests
+
+
+class ResponseTooLarge(IOError):
+    pass
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session() -> "requests.Session":
+    """
+    The keep-alive session shared by every outbound fetch.
+    Each host gets a pool of at most HTTP_MAX_PER_HOST connections,
+    further requests to that host wait for a free one.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            session.headers["User-Agent"] = HTTP_USER_AGENT
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_MAX_HOSTS,
+                pool_maxsize=HTTP_MAX_PER_HOST,
+                pool_block=True,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+    return _http_session
+
+
+def fetch(
+    url: str, headers: Optional[dict] = None, params: Optional[dict] = None
+) -> "requests.Response":
+    """
+    GETs url through the shared session.
+    Raises ResponseTooLarge rather than reading more than HTTP_MAX_RESPONSE_BYTES.
+    """
+    with get_http_session().get(
+        url, headers=headers, params=params, timeout=HTTP_TIMEOUT, stream=True
+    ) as resp:
+        content = bytearray()
+        for chunk in resp.iter_content(chunk_size=64 * 1024):
+            content += chunk
+            if len(content) > HTTP_MAX_RESPONSE_BYTES:
+                raise ResponseTooLarge(f"{url} is over {HTTP_MAX_RESPONSE_BYTES} bytes")
+        resp._content = bytes(content)
+    return resp
+
+
+def fetch_rss_data(url: str, etag: str = "", last_modified: str = "") -> dict:
+    """
+    Fetches and parses a feed, sending the validators of the previous response.
+    Failures and 304s come back in the same shape feedparser gives them.
+    """
+    import requests
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        resp = fetch(url, headers=headers)
+    except (requests.RequestException, ResponseTooLarge) as e:
+        return feedparser.FeedParserDict(
+            bozo=True, bozo_exception=e, entries=[], feed={}, href=url
+        )
+
+    if resp.status_code == 304:
+        rv = feedparser.FeedParserDict(bozo=False, entries=[], feed={})
+    else:
+        response_headers = {k.lower(): v for k, v in resp.headers.items()}
+        response_headers.setdefault("content-location", resp.url)
+        rv = feedparser.parse(resp.content, response_headers=response_headers)
+        rv["etag"] = resp.headers.get("ETag", "")
+        rv["modified"] = resp.headers.get("Last-Modified", "")
+    rv["status"] = resp.status_code
+    rv["href"] = resp.url
+    return rv
+
+
+@functools.cache
+def load_feedfinder():
+    """feedfinder2, set up on first use to fetch through the shared session"""
+    import feedfinder2
+    import requests
+
+    class PooledFeedFinder(feedfinder2.FeedFinder):
+        def get_feed(self, url):
+            try:
+                return fetch(url).text
+            except (requests.RequestException, ResponseTooLarge) as e:
+                logging.warning(f"Error while getting {url}: {e}")
+                return None
+
+    # find_feeds builds its own FeedFinder, point it at the shared session
+    feedfinder2.FeedFinder = PooledFeedFinder
+    return feedfinder2
 
 
 def struct_time_to_datetime(struct_time: time.struct_time):
@@ -29,12 +189,201 @@ def struct_time_to_datetime(struct_time: time.struct_time):
 
 
 def construct_new_articles(feed: Feed) -> list[Article]:
-    new_rss_entries = ArticlePuller(feed).pull_new()
-    builder = ArticleBuilder(feed)
+    puller = ArticlePuller(feed)
+    new_rss_entries = puller.pull_new()
+    builder = ArticleBuilder(feed, puller.known_dates)
     return [builder.from_rss(new_rss_entry) for new_rss_entry in new_rss_entries]
 
 
+def ingest_articles(feed: Feed, articles: list[Article]) -> list[Article]:
+    """
+    Writes a feed's new articles with one insert in one transaction.
+    Articles that are already stored are skipped,
+    so overlapping polls never insert the same entry twice.
+    Inserted articles take their page data from the scrape cache when they can,
+    the rest get a ScrapeJob to fill it in.
+    Inserted articles are added to the timelines of the feed's followers.
+    Returns only the articles this call inserted,
+    never ones an overlapping poll stored first.
+    """
+    fresh = {}
+    for article in articles:
+        fresh.setdefault(article.source_id, article)
+    with transaction.atomic():
+        existing = Article.objects.filter(
+            feed=feed, source_id__in=list(fresh)
+        ).values_list("source_id", flat=True)
+        for source_id in existing:
+            del fresh[source_id]
+        unscraped = {
+            article.source_id for article in apply_cached_scrapes(fresh.values())
+        }
+        try:
+            with transaction.atomic():
+                Article.objects.bulk_create(fresh.values())
+            # Every one of them is ours, bulk_create just can't hand back their keys
+            inserted = list(
+                Article.objects.filter(feed=feed, source_id__in=list(fresh))
+            )
+        except IntegrityError:
+            # An overlapping poll stored some since the check,
+            # insert one at a time to tell which are ours
+            inserted = []
+            for article in fresh.values():
+                try:
+                    with transaction.atomic():
+                        article.save(force_insert=True)
+                except IntegrityError:
+                    continue
+                inserted.append(article)
+        ScrapeJob.objects.bulk_create(
+            [
+                ScrapeJob(article=article, run_after=timezone.now())
+                for article in inserted
+                if article.source_id in unscraped
+            ],
+            ignore_conflicts=True,
+        )
+        fan_out_articles(feed, inserted)
+        record_ingested_articles(feed, inserted)
+        if inserted:
+            transaction.on_commit(bump_timeline_version)
+    return inserted
+
+
+def record_ingested_articles(feed: Feed, articles: list[Article]) -> None:
+    """Keeps the feed's denormalized article_count and last_published_at current"""
+    if not articles:
+        return
+    newest = max(article.published_date for article in articles)
+    Feed.objects.filter(pk=feed.pk).update(
+        article_count=F("article_count") + len(articles),
+        last_published_at=Greatest(
+            Coalesce("last_published_at", Value(newest)), Value(newest)
+        ),
+    )
+    feed.article_count += len(articles)
+    if feed.last_published_at is None or feed.last_published_at < newest:
+        feed.last_published_at = newest
+
+
+def get_timeline_version() -> int:
+    # Seeded from the clock, so a version key that was evicted
+    # never brings back the pages cached under an earlier version
+    return cache.get_or_set(TIMELINE_VERSION_KEY, time.time_ns, timeout=None)
+
+
+def bump_timeline_version() -> None:
+    """Invalidates every cached page that shows the global timeline"""
+    try:
+        cache.incr(TIMELINE_VERSION_KEY)
+    except ValueError:
+        cache.set(TIMELINE_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def fan_out_articles(feed: Feed, articles: list[Article]) -> None:
+    """Adds stored articles to the timeline of each of the feed's followers"""
+    follower_ids = list(feed.followers.values_list("pk", flat=True))
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                article_id=article.pk,
+                published_date=article.published_date,
+            )
+            for user_id in follower_ids
+            for article in articles
+        ),
+        batch_size=TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def follow_feed(user: User, feed: Feed) -> None:
+    """Follows the feed, backfilling the user's timeline with its articles"""
+    with transaction.atomic():
+        user.followed_feeds.add(feed)
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(user=user, article_id=pk, published_date=published_date)
+                for pk, published_date in feed.article_set.values_list(
+                    "pk", "published_date"
+                ).iterator()
+            ),
+            batch_size=TIMELINE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def unfollow_feed(user: User, feed: Feed) -> None:
+    """Unfollows the feed, pruning its articles from the user's timeline"""
+    with transaction.atomic():
+        user.followed_feeds.remove(feed)
+        TimelineEntry.objects.filter(user=user, article__feed=feed).delete()
+
+
+def ingest_new_articles(feed: Feed) -> list[Article]:
+    return ingest_articles(feed, construct_new_articles(feed))
+
+
+def get_due_feeds():
+    """Feeds whose next poll is due, including ones that were never polled"""
+    return Feed.objects.filter(
+        Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=timezone.now())
+    )
+
+
+def iter_due_feeds(chunk_size: int = POLL_CHUNK_SIZE) -> Iterator[Feed]:
+    """
+    Streams the due feeds in primary key order, chunk_size at a time.
+    Unlike a server-side cursor, this is safe while the poll updates the same rows.
+    """
+    last_pk = 0
+    while True:
+        chunk = list(get_due_feeds().filter(pk__gt=last_pk).order_by("pk")[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
+
+
+def clamp_poll_interval(interval: timedelta) -> timedelta:
+    return min(max(interval, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+
+
+def estimate_poll_interval(feed: Feed) -> timedelta:
+    """The median gap between the feed's most recent articles"""
+    dates = list(
+        feed.article_set.order_by("-published_date").values_list(
+            "published_date", flat=True
+        )[:POLL_CADENCE_SAMPLE_SIZE]
+    )
+    if len(dates) < 2:
+        return MIN_POLL_INTERVAL
+    gaps = sorted(newer - older for newer, older in zip(dates, dates[1:]))
+    return clamp_poll_interval(gaps[len(gaps) // 2])
+
+
+def schedule_next_poll(feed: Feed, num_new: int) -> list[str]:
+    """
+    Sets when the feed is due to be polled again.
+    Feeds that published something go back to their estimated cadence,
+    feeds that didn't back off geometrically up to MAX_POLL_INTERVAL.
+    Returns the names of the fields that changed.
+    """
+    if num_new:
+        interval = estimate_poll_interval(feed)
+    else:
+        interval = clamp_poll_interval(
+            (feed.poll_interval or MIN_POLL_INTERVAL) * POLL_BACKOFF_FACTOR
+        )
+    feed.poll_interval = interval
+    feed.next_poll_at = timezone.now() + interval
+    return ["poll_interval", "next_poll_at"]
+
+
 def construct_feeds_for_website(website_url: str) -> list[Feed]:
+    feedfinder2 = load_feedfinder()
     feed_urls = feedfinder2.find_feeds(website_url)
     if not feed_urls:
         if website_url.endswith("/"):
@@ -45,40 +394,99 @@ def construct_feeds_for_website(website_url: str) -> list[Feed]:
     return [Feed.from_url(feed_url) for feed_url in feed_urls]
 
 
-def calc_time_to_read(article: Article, user: User) -> int:
-    if user.is_authenticated:
-        wpm = user.wpm
-    else:
-        wpm = AVERAGE_WPM
-    return math.ceil(article.num_words / wpm)
-
-
-def format_time_to_read(article: Article, user: User) -> int:
-    if article.num_words is None:
-        return ""
-    else:
-        time_to_read = calc_time_to_read(article, user)
-        return f"{time_to_read} min"
-
-
 def set_url_scheme(url: str, scheme: str) -> str:
     """
     Converts urls without a scheme to new scheme.
     Updates urls with a scheme to use the new scheme
     """
-    coerced_url = feedfinder2.coerce_url(url)
+    coerced_url = load_feedfinder().coerce_url(url)
     parsed_url = urllib.parse.urlparse(coerced_url)
     http_url = parsed_url._replace(scheme=scheme)
     return urllib.parse.urlunparse(http_url)
 
 
-def get_quote(min_length: int = 250) -> dict:
-    resp = requests.get(
-        f"{QUOTE_API_BASE_URL}/quotes", params={"minLength": min_length}
-    )
-    resp.raise_for_status()
-    all_quotes = resp.json()["results"]
-    return random.choice(all_quotes)
+class QuoteIndex:
+    """
+    Quotes sorted by length, so the ones of at least some length
+    are the tail of the list and one of them can be picked without a scan.
+    """
+
+    def __init__(self, quotes: list[dict]):
+        self.quotes = sorted(quotes, key=lambda quote: len(quote["content"]))
+        self.lengths = [len(quote["content"]) for quote in self.quotes]
+
+    def pick(self, min_length: int) -> Optional[dict]:
+        start = bisect.bisect_left(self.lengths, min_length)
+        if start == len(self.quotes):
+            return None
+        return self.quotes[random.randrange(start, len(self.quotes))]
+
+
+@functools.cache
+def load_bundled_quotes() -> QuoteIndex:
+    with open(QUOTE_CORPUS_PATH) as f:
+        return QuoteIndex(json.load(f))
+
+
+def fetch_quotes(min_length: int) -> list[dict]:
+    """Every quote of at least min_length from the quote API"""
+    quotes = []
+    page = total_pages = 1
+    while page <= total_pages:
+        resp = fetch(
+            f"{QUOTE_API_BASE_URL}/quotes",
+            params={"minLength": min_length, "limit": 150, "page": page},
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        quotes.extend(
+            {"content": quote["content"], "author": quote["author"]}
+            for quote in data["results"]
+        )
+        total_pages = data.get("totalPages", 1)
+        page += 1
+    return quotes
+
+
+def refresh_quote_cache(min_length: int = QUOTE_MIN_LENGTH) -> int:
+    """
+    Stores the API's quotes in the cache for QUOTE_CACHE_TTL.
+    Returns how many were stored. Run by the refresh_quotes command, never by a request.
+    """
+    quotes = fetch_quotes(min_length)
+    if quotes:
+        cache.set(QUOTE_CACHE_KEY, quotes, QUOTE_CACHE_TTL)
+    return len(quotes)
+
+
+_quote_index = None
+_quote_index_loaded_at = 0.0
+
+
+def get_quote_index() -> QuoteIndex:
+    """
+    The refreshed quotes when the cache has them, the bundled ones otherwise.
+    Each process keeps its index for QUOTE_INDEX_RELOAD_INTERVAL seconds
+    rather than reading the cache on every request.
+    """
+    global _quote_index, _quote_index_loaded_at
+    if (
+        _quote_index is None
+        or time.monotonic() - _quote_index_loaded_at > QUOTE_INDEX_RELOAD_INTERVAL
+    ):
+        quotes = cache.get(QUOTE_CACHE_KEY)
+        _quote_index = QuoteIndex(quotes) if quotes else load_bundled_quotes()
+        _quote_index_loaded_at = time.monotonic()
+    return _quote_index
+
+
+def get_quote(min_length: int = QUOTE_MIN_LENGTH) -> dict:
+    """A random quote of at least min_length, or the longest there is"""
+    quote = get_quote_index().pick(min_length)
+    if quote is None:
+        bundled = load_bundled_quotes()
+        quote = bundled.pick(min_length) or bundled.quotes[-1]
+    return quote
 
 
 def get_favicon_url(url: str) -> str:
@@ -87,34 +495,371 @@ def get_favicon_url(url: str) -> str:
     return FAVICON_API_BASE_URL + "?" + query
 
 
-def format_article_date(article: Article) -> str:
-    now = datetime.now()
-    if now.date() == article.published_date.date():
-        format_str = "Today, %H:%M"
-    elif (now.date() - timedelta(days=1)) == article.published_date.date():
-        format_str = "Yesterday, %H:%M"
-    elif now.year == article.published_date.year:
-        format_str = "%b. %d, %H:%M"
+def article_date_bucket(published_date: datetime, today: date) -> str:
+    if today == published_date.date():
+        return "today"
+    elif (today - timedelta(days=1)) == published_date.date():
+        return "yesterday"
+    elif today.year == published_date.year:
+        return "this_year"
     else:
-        format_str = "%b. %d, %Y, %H:%M"
-    return article.published_date.strftime(format_str)
+        return "older"
+
+
+def load_read_article_ids(user: User, articles: list[Article]) -> set[int]:
+    """Which of the articles the user has read, an index seek per article"""
+    if not user.is_authenticated or not articles:
+        return set()
+    return set(
+        ReadEvent.objects.filter(
+            user=user, article_id__in=[article.id for article in articles]
+        ).values_list("article_id", flat=True)
+    )
+
+
+def record_reads(user: User, reads: dict[int, datetime]) -> list[ReadEvent]:
+    """
+    Stores a batch of reads, keyed by article id, checking the ids in one query.
+    Unknown articles are dropped, read times from the future are pulled back to now,
+    and articles the user has already read keep their first read.
+    Returns the reads that were new, which are also added to the user's rollups.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        article_feeds = dict(
+            Article.objects.filter(id__in=list(reads)).values_list("id", "feed_id")
+        )
+        already_read = set(
+            ReadEvent.objects.filter(
+                user=user, article_id__in=list(article_feeds)
+            ).values_list("article_id", flat=True)
+        )
+        read_events = [
+            ReadEvent(
+                user=user, article_id=article_id, read_at=min(reads[article_id], now)
+            )
+            for article_id in article_feeds
+            if article_id not in already_read
+        ]
+        try:
+            with transaction.atomic():
+                ReadEvent.objects.bulk_create(read_events)
+            inserted = read_events
+        except IntegrityError:
+            # A concurrent request stored some since the check,
+            # insert one at a time so only ours reach the rollups
+            inserted = []
+            for event in read_events:
+                try:
+                    with transaction.atomic():
+                        event.save(force_insert=True)
+                except IntegrityError:
+                    continue
+                inserted.append(event)
+        add_to_rollups(
+            user,
+            Counter(
+                (timezone.localdate(event.read_at), article_feeds[event.article_id])
+                for event in inserted
+            ),
+        )
+    return inserted
+
+
+def add_to_rollups(user: User, counts: dict[tuple[date, int], int]) -> None:
+    """Adds read counts keyed by (day, feed id) to the user's rollups"""
+    ReadingRollup.objects.bulk_create(
+        (ReadingRollup(user=user, day=day, feed_id=feed_id) for day, feed_id in counts),
+        ignore_conflicts=True,
+    )
+    # A batch of reads rarely spans more than a day or a handful of feeds
+    for (day, feed_id), count in counts.items():
+        ReadingRollup.objects.filter(user=user, day=day, feed_id=feed_id).update(
+            count=F("count") + count
+        )
+
+
+def rebuild_rollups(user: Optional[User] = None) -> int:
+    """
+    Recounts the rollups from the read log, for one user or everyone.
+    Returns how many rollup rows were written.
+    """
+    read_events = ReadEvent.objects.all()
+    rollups = ReadingRollup.objects.all()
+    if user is not None:
+        read_events = read_events.filter(user=user)
+        rollups = rollups.filter(user=user)
+    counts = (
+        read_events.annotate(day=TruncDate("read_at"))
+        .values("user_id", "day", "article__feed_id")
+        .annotate(count=Count("id"))
+        .values_list("user_id", "day", "article__feed_id", "count")
+    )
+    with transaction.atomic():
+        rollups.delete()
+        created = ReadingRollup.objects.bulk_create(
+            (
+                ReadingRollup(user_id=user_id, day=day, feed_id=feed_id, count=count)
+                for user_id, day, feed_id, count in counts.iterator()
+            ),
+            batch_size=ROLLUP_BATCH_SIZE,
+        )
+    return len(created)
+
+
+def prepare_article_rows(articles: list[Article], user: User) -> None:
+    """
+    Sets the display fields of a page of articles in one pass,
+    reading the clock and the user's reading speed once rather than per row.
+    Sets time_to_read, date_display, and date_bucket,
+    which is what date_display depends on besides the article itself.
+    Also sets is_read, looking up the whole page's read state in one query.
+    """
+    today = datetime.now().date()
+    wpm = user.wpm if user.is_authenticated else AVERAGE_WPM
+    read_ids = load_read_article_ids(user, articles)
+    for article in articles:
+        article.is_read = article.id in read_ids
+        if article.num_words is None:
+            article.time_to_read = ""
+        else:
+            article.time_to_read = f"{math.ceil(article.num_words / wpm)} min"
+        article.date_bucket = article_date_bucket(article.published_date, today)
+        article.date_display = article.published_date.strftime(
+            ARTICLE_DATE_FORMATS[article.date_bucket]
+        )
+
+
+def load_known_published_dates(feed: Feed) -> dict[str, datetime]:
+    """
+    Maps the links of the feed's undated entries to the date they were first stored.
+    One query per feed, bounded by the size of the feed document.
+    """
+    links = [
+        rss_entry["link"]
+        for rss_entry in feed.rss_data["entries"]
+        if "published_parsed" not in rss_entry
+    ]
+    if not links:
+        return {}
+    known_dates = {}
+    for url, published_date in Article.objects.filter(
+        feed=feed, url__in=links
+    ).values_list("url", "published_date"):
+        if url not in known_dates or published_date < known_dates[url]:
+            known_dates[url] = published_date
+    return known_dates
 
 
-def calc_rss_published_date(rss_entry: dict, feed: Feed) -> datetime:
+def calc_rss_published_date(
+    rss_entry: dict, known_dates: dict[str, datetime]
+) -> datetime:
     if "published_parsed" in rss_entry:
         return struct_time_to_datetime(rss_entry["published_parsed"])
     else:
-        existing = (
-            Article.objects.filter(url=rss_entry["link"], feed=feed)
-            .order_by("published_date")
-            .first()
-        )
+        existing = known_dates.get(rss_entry["link"])
         if existing is not None:
-            return existing.published_date
+            return existing
         else:
             return timezone.now()
 
 
+def encode_cursor(published_date: datetime, pk: int) -> str:
+    raw = f"{published_date.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Raises ValueError for cursors encode_cursor didn't make"""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode((cursor + padding).encode()).decode()
+    except (binascii.Error, UnicodeError) as e:
+        raise ValueError(f"Bad cursor {cursor!r}") from e
+    published_date, _, pk = raw.partition("|")
+    pk = int(pk)
+    # Past what a database integer holds the query itself would fail
+    if not 0 < pk < 2**63:
+        raise ValueError(f"Bad cursor {cursor!r}")
+    return datetime.fromisoformat(published_date), pk
+
+
+class TimelinePage:
+    """
+    One page of a timeline, newest first.
+    The cursors are opaque strings for the pages on either side, None at the ends.
+    """
+
+    def __init__(
+        self,
+        object_list: list,
+        newer_cursor: Optional[str] = None,
+        older_cursor: Optional[str] = None,
+    ):
+        self.object_list = object_list
+        self.newer_cursor = newer_cursor
+        self.older_cursor = older_cursor
+
+
+def paginate_timeline(
+    query,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    page_size: int = PAGE_SIZE,
+    date_field: str = "published_date",
+    pk_field: str = "pk",
+) -> TimelinePage:
+    """
+    Seeks on (date_field, pk_field) instead of counting and offsetting,
+    so every page costs the same however deep it is.
+    before gives the page older than a cursor, after the page newer than it.
+    """
+
+    def cursor_for(row) -> str:
+        return encode_cursor(getattr(row, date_field), getattr(row, pk_field))
+
+    if after is not None:
+        published_date, pk = decode_cursor(after)
+        # The redundant range on date_field alone is what lets the planner seek
+        rows = list(
+            query.filter(
+                Q(**{f"{date_field}__gte": published_date}),
+                Q(**{f"{date_field}__gt": published_date})
+                | Q(**{f"{pk_field}__gt": pk}),
+            ).order_by(date_field, pk_field)[: page_size + 1]
+        )
+        has_newer = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        if not rows:
+            return paginate_timeline(
+                query, page_size=page_size, date_field=date_field, pk_field=pk_field
+            )
+        return TimelinePage(
+            rows,
+            newer_cursor=cursor_for(rows[0]) if has_newer else None,
+            older_cursor=cursor_for(rows[-1]),
+        )
+
+    if before is not None:
+        published_date, pk = decode_cursor(before)
+        query = query.filter(
+            Q(**{f"{date_field}__lte": published_date}),
+            Q(**{f"{date_field}__lt": published_date}) | Q(**{f"{pk_field}__lt": pk}),
+        )
+    rows = list(query.order_by(f"-{date_field}", f"-{pk_field}")[: page_size + 1])
+    has_older = len(rows) > page_size
+    rows = rows[:page_size]
+    return TimelinePage(
+        rows,
+        newer_cursor=cursor_for(rows[0]) if before is not None and rows else None,
+        older_cursor=cursor_for(rows[-1]) if has_older else None,
+    )
+
+
+def build_search_query(search_string: str) -> str:
+    """
+    Turns free text into an FTS5 query that needs every word,
+    treating the last one as a prefix since it may still be being typed.
+    Each word is quoted, so FTS5 operators typed by the user are taken literally.
+    """
+    terms = [f'"{term}"' for term in re.findall(r"\w+", search_string)]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_ids(table: str, search_string: str, limit: int) -> list[int]:
+    """
+    Row ids from one of the FTS tables, best match first.
+    Only the newest matches are ranked, so a common word costs no more
+    than a rare one however big the table gets.
+    """
+    search_query = build_search_query(search_string)
+    if not search_query:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT rowid FROM (
+                SELECT rowid, rank FROM {table} WHERE {table} MATCH %s
+                ORDER BY rowid DESC LIMIT %s
+            ) ORDER BY rank LIMIT %s
+            """,
+            [search_query, SEARCH_CANDIDATE_LIMIT, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def in_rank_order(query, ids: list[int]) -> list:
+    rows = query.in_bulk(ids)
+    return [rows[pk] for pk in ids if pk in rows]
+
+
+def search_feeds(
+    search_string: str, query=None, limit: int = SEARCH_RESULT_LIMIT
+) -> list[Feed]:
+    ids = search_ids("muffin_feed_fts", search_string, limit)
+    return in_rank_order(query if query is not None else Feed.objects, ids)
+
+
+def search_articles(
+    search_string: str, query=None, limit: int = SEARCH_RESULT_LIMIT
+) -> list[Article]:
+    ids = search_ids("muffin_article_fts", search_string, limit)
+    return in_rank_order(query if query is not None else Article.objects, ids)
+
+
+def build_search_triggers(table: str, columns: tuple[str, ...]) -> dict[str, str]:
+    """The triggers that keep a table's FTS index in sync, keyed by name"""
+    fts_table = f"{table}_fts"
+    names = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    insert = f"INSERT INTO {fts_table}(rowid, {names}) VALUES (new.id, {new_values});"
+    delete = (
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {names})"
+        f" VALUES ('delete', old.id, {old_values});"
+    )
+    return {
+        f"{fts_table}_insert": f"AFTER INSERT ON {table} BEGIN {insert} END",
+        f"{fts_table}_delete": f"AFTER DELETE ON {table} BEGIN {delete} END",
+        f"{fts_table}_update": (
+            f"AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END"
+        ),
+    }
+
+
+def ensure_search_triggers(using: str = "default", **kwargs) -> None:
+    """
+    Recreates any search index trigger a migration dropped, and rebuilds
+    the index it was keeping, since writes made without it were missed.
+    On SQLite, altering a column copies the table and drops the original,
+    taking its triggers along. Runs after every migrate.
+    """
+    db = connections[using]
+    if db.vendor != "sqlite":
+        return
+    with db.cursor() as cursor:
+        cursor.execute("SELECT type, name FROM sqlite_master")
+        existing = set(cursor.fetchall())
+        for table, columns in SEARCH_INDEXED_COLUMNS.items():
+            fts_table = f"{table}_fts"
+            # Migrated back to before the index existed
+            if ("table", fts_table) not in existing:
+                continue
+            triggers = build_search_triggers(table, columns)
+            missing = [name for name in triggers if ("trigger", name) not in existing]
+            for name in missing:
+                cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {triggers[name]}")
+            if missing:
+                logging.warning(
+                    f"Recreated {', '.join(missing)}, rebuilding {fts_table}"
+                )
+                cursor.execute(
+                    f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"
+                )
+
+
 class TimerMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -129,8 +874,8 @@ class TimerMiddleware:
 class ArticlePuller:
     def __init__(self, feed: Feed):
         self.feed = feed
-        # no optional chaining :(
-        self.cutoff_date = getattr(feed.most_recent, "published_date", None)
+        self.cutoff_date = feed.last_published_at
+        self.known_dates = load_known_published_dates(feed)
 
     def pull_new(self) -> list[dict]:
         return [
@@ -142,97 +887,487 @@ class ArticlePuller:
     def is_new_entry(self, rss_entry: dict) -> bool:
         return (
             self.cutoff_date is None
-            or calc_rss_published_date(rss_entry, self.feed) > self.cutoff_date
+            or calc_rss_published_date(rss_entry, self.known_dates) > self.cutoff_date
         )
 
 
-class ScraperConfig(ScraperConfigBase):
-    def __init__(self):
-        super().__init__()
-        self.keep_article_html = True
+@functools.cache
+def get_scraper_config():
+    from newspaper.configuration import Configuration
 
+    config = Configuration()
+    config.keep_article_html = True
+    # Checking image candidates would download them outside of fetch,
+    # take the top image from the page as is instead
+    config.fetch_images = False
+    return config
 
-class ArticleBuilder:
-    scraper_config = ScraperConfig()
 
-    def __init__(self, feed: Feed):
+class ArticleBuilder:
+    def __init__(self, feed: Feed, known_dates: Optional[dict[str, datetime]] = None):
         self.feed = feed
+        if known_dates is None:
+            known_dates = load_known_published_dates(feed)
+        self.known_dates = known_dates
 
     def from_rss(self, rss_entry: dict) -> Article:
-        published_date = calc_rss_published_date(rss_entry, self.feed)
-        rv = Article(
+        """
+        Builds an article from the rss metadata alone.
+        The fields that need the article page are filled in later by a ScrapeJob.
+        """
+        published_date = calc_rss_published_date(rss_entry, self.known_dates)
+        return Article(
             feed=self.feed,
-            source_id=rss_entry.get("id", rss_entry.get("guid")),
+            source_id=(
+                rss_entry.get("id") or rss_entry.get("guid") or rss_entry["link"]
+            ),
             published_date=published_date,
             url=rss_entry["link"],
             title=rss_entry["title"],
         )
+
+
+def scrape_article(url: str) -> tuple[str, Optional[int]]:
+    """
+    Downloads and parses an article page.
+    Returns its top image and word count.
+    Touches the network, but not the database, so it is safe to run in a worker process.
+    """
+    from newspaper import Article as ScrapedArticle
+
+    resp = fetch(url)
+    resp.raise_for_status()
+    scraped_article = ScrapedArticle(url, config=get_scraper_config())
+    scraped_article.download(input_html=resp.text)
+    scraped_article.parse()
+    num_words = len(scraped_article.text.split()) if scraped_article.text else None
+    return scraped_article.top_image, num_words
+
+
+def run_scrape_job(job: tuple[str, str]) -> tuple[str, Optional[tuple], str]:
+    """
+    Entry point for scraping worker processes.
+    Takes (key, url) and returns (key, scrape result, error).
+    """
+    key, url = job
+    try:
+        return key, scrape_article(url), ""
+    except Exception as e:
+        return key, None, repr(e)
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalizes the parts of a url that don't change which page it points at:
+    scheme, host case, default ports, fragments and tracking parameters.
+    """
+    try:
+        parsed = urllib.parse.urlsplit(url.strip())
+        port = parsed.port
+    except ValueError:
+        # Feeds link to whatever they like, a url that doesn't parse is its own key
+        return url
+    host = (parsed.hostname or "").removeprefix("www.")
+    if port not in (None, 80, 443):
+        host = f"{host}:{port}"
+    query = sorted(
+        (name, value)
+        for name, value in urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+        if not name.lower().startswith(TRACKING_PARAM_PREFIXES)
+    )
+    return urllib.parse.urlunsplit(
+        ("https", host, parsed.path or "/", urllib.parse.urlencode(query), "")
+    )
+
+
+def get_cached_scrapes(urls: Iterable[str]) -> dict[str, tuple[str, Optional[int]]]:
+    """
+    Maps canonical urls to the (top image, word count) of any fresh scrape of them,
+    from the scrape cache or, failing that, an article stored under the same url.
+    """
+    urls = list(urls)
+    canonical_urls = {canonicalize_url(url) for url in urls}
+    cached = {
+        url: (image_url, num_words)
+        for url, image_url, num_words in Article.objects.filter(
+            url__in=urls, num_words__isnull=False
+        ).values_list("url", "image_url", "num_words")
+    }
+    cached = {canonicalize_url(url): result for url, result in cached.items()}
+    cached.update(
+        (canonical_url, (image_url, num_words))
+        for canonical_url, image_url, num_words in ScrapeResult.objects.filter(
+            canonical_url__in=canonical_urls,
+            scraped_at__gte=timezone.now() - SCRAPE_CACHE_TTL,
+        ).values_list("canonical_url", "image_url", "num_words")
+    )
+    return cached
+
+
+def prune_scrape_results() -> int:
+    """Deletes the scrape cache entries too old to be used, returns how many"""
+    num_deleted, _ = ScrapeResult.objects.filter(
+        scraped_at__lt=timezone.now() - SCRAPE_CACHE_TTL
+    ).delete()
+    return num_deleted
+
+
+def apply_cached_scrapes(articles: Iterable[Article]) -> list[Article]:
+    """
+    Fills in the page data of articles that were already scraped for another feed.
+    Returns the articles that still need scraping.
+    """
+    articles = list(articles)
+    cached = get_cached_scrapes(article.url for article in articles)
+    unscraped = []
+    for article in articles:
+        result = cached.get(canonicalize_url(article.url))
+        if result is None:
+            unscraped.append(article)
+        else:
+            article.image_url, article.num_words = result
+    return unscraped
+
+
+def claim_scrape_jobs(limit: int) -> list[ScrapeJob]:
+    """
+    Leases up to limit due jobs, so that concurrent workers don't pick them up too.
+    A job whose worker dies becomes due again once its lease runs out.
+    """
+    now = timezone.now()
+    lease_until = now + SCRAPE_LEASE
+    with transaction.atomic():
+        job_ids = list(
+            ScrapeJob.objects.filter(run_after__lte=now)
+            .order_by("run_after")
+            .values_list("pk", flat=True)[:limit]
+        )
+        ScrapeJob.objects.filter(pk__in=job_ids, run_after__lte=now).update(
+            run_after=lease_until, attempts=F("attempts") + 1
+        )
+    return list(
+        ScrapeJob.objects.select_related("article").filter(
+            pk__in=job_ids, run_after=lease_until
+        )
+    )
+
+
+def finish_scrape_job(job: ScrapeJob, result: Optional[tuple], error: str) -> None:
+    """
+    Stores a scrape's result, or schedules the job's next attempt.
+    Writes are updates rather than saves, since the article and with it
+    the job may have been deleted while the page was being scraped.
+    """
+    if result is not None:
+        article = job.article
+        article.image_url, article.num_words = result
+        with transaction.atomic():
+            num_updated = Article.objects.filter(pk=article.pk).update(
+                image_url=article.image_url, num_words=article.num_words
+            )
+            job.delete()
+            ScrapeResult.objects.update_or_create(
+                canonical_url=canonicalize_url(article.url),
+                defaults={
+                    "image_url": article.image_url,
+                    "num_words": article.num_words,
+                    "scraped_at": timezone.now(),
+                },
+            )
+            if num_updated:
+                transaction.on_commit(bump_timeline_version)
+        return
+    if job.attempts >= SCRAPE_MAX_ATTEMPTS:
+        logging.warning(f"Giving up on {job.article.url}: {error}")
+        job.run_after = None
+    else:
+        job.run_after = timezone.now() + SCRAPE_RETRY_DELAY * 2 ** (job.attempts - 1)
+    job.last_error = error[:200]
+    ScrapeJob.objects.filter(pk=job.pk).update(
+        run_after=job.run_after, last_error=job.last_error
+    )
+
+
+@dataclass
+class FeedPollReport:
+    feed: Feed
+    num_new: int = 0
+    fetch_time: float = 0.0
+    total_time: float = 0.0
+    error: Optional[str] = None
+    skipped: bool = False
+    started: float = field(default_factory=time.monotonic, repr=False)
+
+
+@dataclass
+class PollSummary:
+    num_polled: int = 0
+    num_skipped: int = 0
+    num_inserted: int = 0
+    num_errors: int = 0
+
+    def add(self, report: FeedPollReport) -> None:
+        if report.skipped:
+            self.num_skipped += 1
+            return
+        self.num_polled += 1
+        self.num_inserted += report.num_new
+        self.num_errors += report.error is not None
+
+
+class FeedPoller:
+    """
+    Polls feeds concurrently.
+    Fetching runs in a thread pool,
+    limited globally by max_workers and per host by max_per_host.
+    Everything that touches the database stays on the calling thread,
+    so the rows written match polling the feeds one at a time.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = POLL_MAX_WORKERS,
+        max_per_host: int = POLL_MAX_PER_HOST,
+        max_waiting: int = POLL_MAX_WAITING,
+    ):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.max_waiting = max_waiting
+        self._stopped = threading.Event()
+        self._deadline = None
+
+    def stop(self) -> None:
+        """Lets fetches in flight finish, but starts no new ones"""
+        self._stopped.set()
+
+    def _is_stopping(self) -> bool:
+        return self._stopped.is_set() or (
+            self._deadline is not None and time.monotonic() > self._deadline
+        )
+
+    def _fetch(self, feed: Feed) -> Optional[float]:
+        if self._is_stopping():
+            return None
+        start = time.monotonic()
+        feed.trim_rss_data()
+        return time.monotonic() - start
+
+    def poll(
+        self, feeds: Iterable[Feed], max_duration: Optional[float] = None
+    ) -> PollSummary:
+        summary = PollSummary()
+        for report in self.iter_poll(feeds, max_duration):
+            summary.add(report)
+        return summary
+
+    def iter_poll(
+        self, feeds: Iterable[Feed], max_duration: Optional[float] = None
+    ) -> Iterator[FeedPollReport]:
+        """
+        Polls the feeds, yielding a report for each as it finishes.
+        Feeds are pulled from the iterable as workers free up,
+        so only a bounded number of them (and their parsed documents) are alive at once.
+        A feed whose host already has max_per_host fetches running waits
+        for one of them to finish, without holding up a worker.
+        Feeds not started within max_duration seconds are skipped
+        and left due for the next poll.
+        Once stopped or past the deadline no more feeds are pulled from the iterable,
+        only the ones already pulled are reported.
+        """
+        if max_duration is not None:
+            self._deadline = time.monotonic() + max_duration
+        feeds = iter(feeds)
+        waiting = defaultdict(deque)
+        num_waiting = 0
+        fetching = Counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {}
+
+            def submit(feed: Feed, host: str) -> None:
+                fetching[host] += 1
+                future = executor.submit(self._fetch, feed)
+                pending[future] = FeedPollReport(feed)
+
+            while True:
+                # Pull until every worker is busy, feeds whose host is busy wait
+                while (
+                    len(pending) < self.max_workers
+                    and num_waiting < self.max_waiting
+                    and not self._is_stopping()
+                ):
+                    feed = next(feeds, None)
+                    if feed is None:
+                        break
+                    host = urllib.parse.urlparse(feed.url).netloc
+                    if fetching[host] < self.max_per_host:
+                        submit(feed, host)
+                    else:
+                        waiting[host].append(feed)
+                        num_waiting += 1
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    report = pending.pop(future)
+                    host = urllib.parse.urlparse(report.feed.url).netloc
+                    fetching[host] -= 1
+                    if waiting[host] and not self._is_stopping():
+                        submit(waiting[host].popleft(), host)
+                        num_waiting -= 1
+                    self._on_fetched(future, report)
+                    yield report
+        # Stopped before their host was free, they stay due
+        for host_feeds in waiting.values():
+            for feed in host_feeds:
+                yield FeedPollReport(feed, skipped=True)
+
+    def _on_fetched(self, future, report: FeedPollReport) -> None:
+        feed = report.feed
         try:
-            scraped_article = ScrapedArticle(
-                rss_entry["link"], config=self.scraper_config
+            fetch_time = future.result()
+            if fetch_time is None:
+                report.skipped = True
+                return
+            report.fetch_time = fetch_time
+            if not feed.is_not_modified:
+                new_articles = construct_new_articles(feed)
+                report.num_new = len(ingest_articles(feed, new_articles))
+            changed = feed.update_validators()
+            if not feed.is_not_modified and feed.rss_data["bozo"]:
+                feed.is_bozo = True
+                changed.append("is_bozo")
+            changed += schedule_next_poll(feed, report.num_new)
+            feed.last_polled_at = timezone.now()
+            changed.append("last_polled_at")
+            feed.save(update_fields=changed)
+        except Exception as e:
+            logging.exception(f"Failed to poll {feed.url}")
+            report.error = repr(e)
+            # Back off, or a feed that keeps failing would be fetched on every poll
+            schedule_next_poll(feed, 0)
+            Feed.objects.filter(pk=feed.pk).update(
+                poll_interval=feed.poll_interval, next_poll_at=feed.next_poll_at
             )
-            scraped_article.download()
-            scraped_article.parse()
-        except ScrapedArticleException:
-            ...
-        else:
-            rv.image_url = scraped_article.top_image
-            if scraped_article.text:
-                rv.num_words = len(scraped_article.text.split())
 
-        return rv
+        report.total_time = time.monotonic() - report.started
+        logging.info(
+            f"Polled {feed.url}: {report.num_new} new, "
+            f"fetch {report.fetch_time:.2f}s, total {report.total_time:.2f}s"
+            + (f", error {report.error}" if report.error else "")
+        )
 
 
 class UserdataFormatter:
-    def __init__(self, user: User):
+    """
+    Writes a user's data out as JSON a piece at a time,
+    so exporting years of reads takes no more memory than exporting a day of them.
+    """
+
+    # What model_to_dict would give for each article, read straight from the join
+    article_fields = [field.name for field in Article._meta.concrete_fields]
+
+    def __init__(self, user: User, chunk_size: int = EXPORT_CHUNK_SIZE):
         self.user = user
+        self.chunk_size = chunk_size
 
-    def as_dict(self) -> dict:
-        return {
-            "user": model_to_dict(
-                self.user,
-                fields=[
-                    "last_login",
-                    "is_superuser",
-                    "username",
-                    "email",
-                    "is_active",
-                    "date_joined",
-                    "wpm",
-                ],
-            ),
-            "followed_feeds": [
-                model_to_dict(feed) for feed in self.user.followed_feeds.all()
-            ],
-            "read_events": [
-                {
-                    "read_at": read_event.read_at.isoformat(),
-                    "article": model_to_dict(read_event.article),
-                }
-                for read_event in self.user.readevent_set.select_related(
-                    "article"
-                ).all()
+    def user_dict(self) -> dict:
+        return model_to_dict(
+            self.user,
+            fields=[
+                "last_login",
+                "is_superuser",
+                "username",
+                "email",
+                "is_active",
+                "date_joined",
+                "wpm",
             ],
-        }
+        )
+
+    def iter_read_events(self) -> Iterator[dict]:
+        rows = self.user.readevent_set.values_list(
+            "read_at", *(f"article__{name}" for name in self.article_fields)
+        ).iterator(chunk_size=self.chunk_size)
+        for read_at, *article in rows:
+            yield {
+                "read_at": read_at.isoformat(),
+                "article": dict(zip(self.article_fields, article)),
+            }
+
+    def iter_json(self) -> Iterator[str]:
+        encoder = DjangoJSONEncoder()
+        followed_feeds = [
+            model_to_dict(feed) for feed in self.user.followed_feeds.all()
+        ]
+        yield '{{"user": {}, "followed_feeds": {}, "read_events": ['.format(
+            encoder.encode(self.user_dict()), encoder.encode(followed_feeds)
+        )
+        read_events = self.iter_read_events()
+        separator = ""
+        while chunk := list(itertools.islice(read_events, self.chunk_size)):
+            yield separator + ", ".join(encoder.encode(event) for event in chunk)
+            separator = ", "
+        yield "]}"
+
+
+def load_daily_read_counts(user: User, since: Optional[date] = None) -> dict[date, int]:
+    """Reads per day, summed from the rollups so the cost grows with days not reads"""
+    query = ReadingRollup.objects.filter(user=user)
+    if since is not None:
+        query = query.filter(day__gte=since)
+    return dict(
+        query.values("day").annotate(count=Sum("count")).values_list("day", "count")
+    )
 
 
-def render_usage_plot(activity: list[ReadEvent]) -> plotly.graph_objects.Figure:
-    sort_key = operator.attrgetter("read_at")
-    start = min(activity, key=sort_key).read_at.date()
-    end = timezone.now().date()
-    num_days = (end - start).days + 1
-    x = [start + timedelta(days=i) for i in range(num_days)]
-    y = [0] * num_days
-    for read_event in activity:
-        idx = (read_event.read_at.date() - start).days
-        y[idx] += 1
-    return px.line(
-        x=x, y=y, title="Usage", labels={"x": "", "y": ""}, range_y=[0, max(y)]
+def load_feed_read_counts(
+    user: User, since: Optional[date] = None
+) -> list[tuple[str, int]]:
+    """Reads per feed title, most read first"""
+    query = ReadingRollup.objects.filter(user=user)
+    if since is not None:
+        query = query.filter(day__gte=since)
+    feed_counts = (
+        query.values("feed_id", "feed__title")
+        .annotate(count=Sum("count"))
+        .values_list("feed__title", "count")
     )
+    # One row per feed, so sorting here is cheaper than a sort in the query plan
+    return sorted(feed_counts, key=lambda feed_count: feed_count[1], reverse=True)
 
 
-def render_favorites_plot(activity: list[ReadEvent]) -> plotly.graph_objects.Figure:
-    cnt = Counter(event.article.feed.title for event in activity)
-    # Unzipping looks so strange
-    names, values = zip(*cnt.items())
-    return px.pie(names=names, values=values, title="Favorites")
+def fill_daily_counts(
+    counts: dict[date, int], start: date, end: date
+) -> tuple[list[date], list[int]]:
+    """Every day from start to end, with zero for the days without reads"""
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    return days, [counts.get(day, 0) for day in days]
+
+
+def build_stats_payload(user: User, window: Optional[int] = None) -> dict:
+    """
+    The series the stats page charts, over the last window days or all of history.
+    Daily counts run from start to today with no gaps, so the dates aren't sent.
+    """
+    today = timezone.localdate()
+    # Today is the last of the window's days
+    since = today - timedelta(days=window - 1) if window is not None else None
+    daily_counts = load_daily_read_counts(user, since)
+    start = since if since is not None else min(daily_counts, default=today)
+    _, counts = fill_daily_counts(daily_counts, start, today)
+    feed_counts = load_feed_read_counts(user, since)
+    return {
+        "start": start.isoformat(),
+        "counts": counts,
+        "feeds": [title for title, _ in feed_counts],
+        "feed_counts": [count for _, count in feed_counts],
+    }
+
+
+def get_stats_etag(user: User, window: Optional[int] = None) -> str:
+    """
+    Changes whenever the payload can: on a new read, a new day, or another window.
+    The newest read is found by id, since reads can arrive with earlier read_at.
+    """
+    latest_read = ReadEvent.objects.filter(user=user).aggregate(Max("id"))["id__max"]
+    return f"{latest_read}-{timezone.localdate().isoformat()}-{window}"
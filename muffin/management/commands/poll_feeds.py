@@ -0,0 +1,63 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from muffin.constants import POLL_MAX_WORKERS
+from muffin.controllers import FeedPoller, iter_due_feeds
+
+
+class Command(BaseCommand):
+    help = "Polls due feeds in a loop, independently of the web workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Run a single cycle and exit"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=300,
+            help="Seconds between the starts of consecutive cycles",
+        )
+        parser.add_argument(
+            "--max-duration",
+            type=float,
+            default=None,
+            help="Seconds a cycle may spend starting fetches, the rest wait a cycle",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=POLL_MAX_WORKERS,
+            help="Number of feeds fetched at once",
+        )
+
+    def handle(self, *args, once, interval, max_duration, concurrency, **options):
+        self.stopping = threading.Event()
+        self.poller = None
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while not self.stopping.is_set():
+            start = time.monotonic()
+            self.poller = FeedPoller(max_workers=concurrency)
+            summary = self.poller.poll(iter_due_feeds(), max_duration=max_duration)
+            elapsed = time.monotonic() - start
+
+            self.stdout.write(
+                f"Polled {summary.num_polled} feeds ({summary.num_skipped} skipped), "
+                f"inserted {summary.num_inserted} articles, "
+                f"{summary.num_errors} errors in {elapsed:.1f}s"
+            )
+
+            if once:
+                break
+            self.stopping.wait(max(interval - elapsed, 0))
+
+    def stop(self, signum, frame):
+        self.stderr.write("Stopping after the feeds in flight")
+        self.stopping.set()
+        if self.poller is not None:
+            self.poller.stop()
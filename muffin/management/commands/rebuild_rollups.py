@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from muffin.controllers import rebuild_rollups
+from muffin.models import User
+
+
+class Command(BaseCommand):
+    help = "Recounts the daily reading rollups from the read log"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            default=None,
+            help="Email of the only user to rebuild, everyone by default",
+        )
+
+    def handle(self, *args, user, **options):
+        if user is not None:
+            try:
+                user = User.objects.get(email=user)
+            except User.DoesNotExist:
+                raise CommandError(f"No user with email {user}")
+        num_rollups = rebuild_rollups(user)
+        self.stdout.write(f"Wrote {num_rollups} rollups")
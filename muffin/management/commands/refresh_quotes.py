@@ -0,0 +1,25 @@
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from muffin.constants import QUOTE_MIN_LENGTH
+from muffin.controllers import ResponseTooLarge, refresh_quote_cache
+
+
+class Command(BaseCommand):
+    help = "Fetches quotes for the reading speed test into the cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-length",
+            type=int,
+            default=QUOTE_MIN_LENGTH,
+            help="Shortest quote worth keeping, in characters",
+        )
+
+    def handle(self, *args, min_length, **options):
+        try:
+            num_quotes = refresh_quote_cache(min_length)
+        except (requests.RequestException, ResponseTooLarge, KeyError, ValueError) as e:
+            # The cached or bundled quotes keep being served
+            raise CommandError(f"Failed to fetch quotes: {e}")
+        self.stdout.write(f"Cached {num_quotes} quotes")
@@ -0,0 +1,86 @@
+import multiprocessing
+from collections import defaultdict
+import logging
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from muffin.constants import SCRAPE_BATCH_SIZE
+from muffin.controllers import (
+    canonicalize_url,
+    claim_scrape_jobs,
+    finish_scrape_job,
+    prune_scrape_results,
+    run_scrape_job,
+)
+
+
+class Command(BaseCommand):
+    help = "Scrapes queued articles in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of scraping processes",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=SCRAPE_BATCH_SIZE,
+            help="Number of jobs claimed from the queue at a time",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of waiting for more jobs",
+        )
+        parser.add_argument(
+            "--idle-sleep",
+            type=float,
+            default=30,
+            help="Seconds to wait before checking an empty queue again",
+        )
+
+    def handle(self, *args, processes, batch_size, once, idle_sleep, **options):
+        # The workers never touch the database, don't let them inherit connections
+        connections.close_all()
+        with multiprocessing.Pool(processes) as pool:
+            while True:
+                jobs = claim_scrape_jobs(batch_size)
+                if not jobs:
+                    # Caught up, a good time to clear out the stale scrape cache
+                    prune_scrape_results()
+                    if once:
+                        break
+                    time.sleep(idle_sleep)
+                    continue
+
+                # Articles that several feeds link to are only scraped once
+                jobs_by_url = defaultdict(list)
+                for job in jobs:
+                    jobs_by_url[canonicalize_url(job.article.url)].append(job)
+                work = [
+                    (canonical_url, same_url_jobs[0].article.url)
+                    for canonical_url, same_url_jobs in jobs_by_url.items()
+                ]
+                num_failed = 0
+                for canonical_url, result, error in pool.imap_unordered(
+                    run_scrape_job, work
+                ):
+                    for job in jobs_by_url[canonical_url]:
+                        # One job's bad data mustn't stop the daemon,
+                        # its lease runs out and it is retried
+                        try:
+                            finish_scrape_job(job, result, error)
+                        except Exception:
+                            logging.exception(f"Failed to finish {job.article.url}")
+                            num_failed += 1
+                            continue
+                        num_failed += result is None
+                self.stdout.write(
+                    f"Scraped {len(jobs) - num_failed} articles, {num_failed} failed"
+                )
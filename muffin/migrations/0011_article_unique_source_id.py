@@ -0,0 +1,52 @@
+# Generated by Django 3.1.4 on 2026-10-18 02:51
+
+from django.db import migrations, models
+
+
+def fill_source_ids(apps, schema_editor):
+    """
+    Falls back to the url for articles without a source id,
+    then merges duplicate entries into the oldest so the unique constraint
+    can be added. Rows pointing at a duplicate are moved to the kept article
+    first, so deleting the duplicates doesn't cascade to them.
+    """
+    Article = apps.get_model("muffin", "Article")
+    Article.objects.filter(source_id__isnull=True).update(source_id=models.F("url"))
+    duplicated = (
+        Article.objects.values("feed_id", "source_id")
+        .annotate(kept_id=models.Min("pk"), num=models.Count("pk"))
+        .filter(num__gt=1)
+        .order_by()
+    )
+    relations = [
+        relation for relation in Article._meta.related_objects if relation.one_to_many
+    ]
+    for group in duplicated:
+        duplicates = Article.objects.filter(
+            feed_id=group["feed_id"], source_id=group["source_id"]
+        ).exclude(pk=group["kept_id"])
+        for relation in relations:
+            relation.related_model.objects.filter(
+                **{f"{relation.field.name}__in": duplicates}
+            ).update(**{relation.field.attname: group["kept_id"]})
+        duplicates.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('muffin', '0010_feed_http_validators'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_source_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='article',
+            name='source_id',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AddConstraint(
+            model_name='article',
+            constraint=models.UniqueConstraint(fields=('feed', 'source_id'), name='unique_feed_source_id'),
+        ),
+    ]
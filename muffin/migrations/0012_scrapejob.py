@@ -0,0 +1,24 @@
+# Generated by Django 3.1.4 on 2026-10-18 02:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('muffin', '0011_article_unique_source_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_after', models.DateTimeField(db_index=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.CharField(blank=True, default='', max_length=200)),
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='muffin.article')),
+            ],
+        ),
+    ]
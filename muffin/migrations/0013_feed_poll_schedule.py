@@ -0,0 +1,23 @@
+# Generated by Django 3.1.4 on 2026-10-18 02:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('muffin', '0012_scrapejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='next_poll_at',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='poll_interval',
+            field=models.DurationField(null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.4 on 2026-10-18 02:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('muffin', '0013_feed_poll_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('canonical_url', models.URLField(unique=True)),
+                ('image_url', models.URLField()),
+                ('num_words', models.IntegerField(null=True)),
+                ('scraped_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.4 on 2026-10-18 02:53
+
+from django.db import migrations, models
+
+
+def backfill_freshness(apps, schema_editor):
+    Feed = apps.get_model("muffin", "Feed")
+    for feed in Feed.objects.annotate(
+        num_articles=models.Count("article"),
+        newest=models.Max("article__published_date"),
+    ):
+        feed.article_count = feed.num_articles
+        feed.last_published_at = feed.newest
+        feed.save(update_fields=["article_count", "last_published_at"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('muffin', '0015_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='article_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='last_polled_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='last_published_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(backfill_freshness, migrations.RunPython.noop),
+    ]
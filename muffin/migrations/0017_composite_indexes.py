@@ -0,0 +1,41 @@
+# Generated by Django 3.1.4 on 2026-10-18 02:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('muffin', '0016_feed_freshness'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='article',
+            name='feed',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='muffin.feed'),
+        ),
+        migrations.AlterField(
+            model_name='readevent',
+            name='read_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='readevent',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='muffin.user'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['feed', '-published_date'], name='article_feed_date'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['feed', 'url'], name='article_feed_url'),
+        ),
+        migrations.AddIndex(
+            model_name='readevent',
+            index=models.Index(fields=['user', 'read_at'], name='readevent_user_read_at'),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 3.1.4 on 2026-10-18 03:10
+
+from django.db import migrations
+
+# External content FTS5 tables over the searchable columns,
+# kept in sync by triggers so every write path (bulk_create included) is covered
+FORWARDS = [
+    """
+    CREATE VIRTUAL TABLE muffin_feed_fts USING fts5(
+        title, description, content='muffin_feed', content_rowid='id', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER muffin_feed_fts_insert AFTER INSERT ON muffin_feed BEGIN
+        INSERT INTO muffin_feed_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER muffin_feed_fts_delete AFTER DELETE ON muffin_feed BEGIN
+        INSERT INTO muffin_feed_fts(muffin_feed_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER muffin_feed_fts_update
+    AFTER UPDATE OF title, description ON muffin_feed BEGIN
+        INSERT INTO muffin_feed_fts(muffin_feed_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO muffin_feed_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO muffin_feed_fts(muffin_feed_fts) VALUES ('rebuild')",
+    """
+    CREATE VIRTUAL TABLE muffin_article_fts USING fts5(
+        title, content='muffin_article', content_rowid='id', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER muffin_article_fts_insert AFTER INSERT ON muffin_article BEGIN
+        INSERT INTO muffin_article_fts(rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+    """
+    CREATE TRIGGER muffin_article_fts_delete AFTER DELETE ON muffin_article BEGIN
+        INSERT INTO muffin_article_fts(muffin_article_fts, rowid, title)
+        VALUES ('delete', old.id, old.title);
+    END
+    """,
+    """
+    CREATE TRIGGER muffin_article_fts_update AFTER UPDATE OF title ON muffin_article
+    BEGIN
+        INSERT INTO muffin_article_fts(muffin_article_fts, rowid, title)
+        VALUES ('delete', old.id, old.title);
+        INSERT INTO muffin_article_fts(rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+    "INSERT INTO muffin_article_fts(muffin_article_fts) VALUES ('rebuild')",
+]
+
+BACKWARDS = [
+    "DROP TRIGGER muffin_article_fts_update",
+    "DROP TRIGGER muffin_article_fts_delete",
+    "DROP TRIGGER muffin_article_fts_insert",
+    "DROP TABLE muffin_article_fts",
+    "DROP TRIGGER muffin_feed_fts_update",
+    "DROP TRIGGER muffin_feed_fts_delete",
+    "DROP TRIGGER muffin_feed_fts_insert",
+    "DROP TABLE muffin_feed_fts",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('muffin', '0017_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(FORWARDS), run_on_sqlite(BACKWARDS)),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.4 on 2026-10-18 02:59
+
+from django.db import migrations, models
+
+
+def drop_repeat_reads(apps, schema_editor):
+    """Keeps the first read of each article so the unique constraint can be added"""
+    ReadEvent = apps.get_model("muffin", "ReadEvent")
+    seen = set()
+    duplicates = []
+    for pk, user_id, article_id in ReadEvent.objects.order_by(
+        "read_at", "pk"
+    ).values_list("pk", "user_id", "article_id"):
+        if (user_id, article_id) in seen:
+            duplicates.append(pk)
+        else:
+            seen.add((user_id, article_id))
+    ReadEvent.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('muffin', '0018_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_repeat_reads, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='readevent',
+            constraint=models.UniqueConstraint(fields=('user', 'article'), name='unique_read_event'),
+        ),
+    ]
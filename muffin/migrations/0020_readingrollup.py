@@ -0,0 +1,48 @@
+# Generated by Django 3.1.4 on 2026-10-18 03:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    ReadEvent = apps.get_model("muffin", "ReadEvent")
+    ReadingRollup = apps.get_model("muffin", "ReadingRollup")
+    counts = (
+        ReadEvent.objects.annotate(day=TruncDate("read_at"))
+        .values("user_id", "day", "article__feed_id")
+        .annotate(count=models.Count("id"))
+        .values_list("user_id", "day", "article__feed_id", "count")
+    )
+    ReadingRollup.objects.bulk_create(
+        (
+            ReadingRollup(user_id=user_id, day=day, feed_id=feed_id, count=count)
+            for user_id, day, feed_id, count in counts.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('muffin', '0019_read_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('feed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='muffin.feed')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='muffin.user')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='readingrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'day', 'feed'), name='unique_reading_rollup'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
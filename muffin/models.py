@@ -1,12 +1,15 @@
 from typing import Optional
 
-import feedparser
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 from .constants import AVERAGE_WPM
 
+# What ingestion reads from a parsed feed, see Feed.trim_rss_data
+RSS_KEPT_KEYS = ("bozo", "status", "etag", "modified")
+RSS_KEPT_ENTRY_KEYS = ("id", "guid", "link", "title", "published_parsed")
+
 
 class Feed(models.Model):
     title = models.CharField(max_length=64, db_index=True)
@@ -14,6 +17,16 @@ class Feed(models.Model):
     url = models.URLField(max_length=256, unique=True)
     favicon_url = models.URLField(max_length=256)
     is_bozo = models.BooleanField(default=False)
+    # Validators from the last response, sent back on the next fetch
+    etag = models.CharField(max_length=256, blank=True, default="")
+    last_modified = models.CharField(max_length=64, blank=True, default="")
+    # Adaptive schedule, see controllers.schedule_next_poll
+    poll_interval = models.DurationField(null=True)
+    next_poll_at = models.DateTimeField(null=True, db_index=True)
+    # Kept current by ingestion, see controllers.record_ingested_articles
+    last_published_at = models.DateTimeField(null=True)
+    article_count = models.IntegerField(default=0)
+    last_polled_at = models.DateTimeField(null=True)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -30,37 +43,168 @@ class Feed(models.Model):
         feed.title = feed.rss_data["channel"]["title"]
         feed.description = feed.rss_data["channel"].get("description", "")
         feed.favicon_url = get_favicon_url(feed.rss_data["channel"]["link"])
+        feed.update_validators()
         return feed
 
-    @property
-    def most_recent(self) -> Optional["Article"]:
-        return self.article_set.order_by("-published_date").first()
-
     @property
     def rss_data(self) -> dict:
         if self._rss_data is None:
-            self._rss_data = feedparser.parse(self.url)
+            from .controllers import fetch_rss_data
+
+            self._rss_data = fetch_rss_data(self.url, self.etag, self.last_modified)
         return self._rss_data
 
+    def trim_rss_data(self) -> None:
+        """
+        Drops the parts of the parsed feed that ingestion never reads,
+        like the content and summary of every entry.
+        """
+        rss_data = self.rss_data
+        self._rss_data = {
+            key: rss_data[key] for key in RSS_KEPT_KEYS if key in rss_data
+        }
+        self._rss_data["entries"] = [
+            {key: rss_entry[key] for key in RSS_KEPT_ENTRY_KEYS if key in rss_entry}
+            for rss_entry in rss_data["entries"]
+        ]
+
+    @property
+    def is_not_modified(self) -> bool:
+        return self.rss_data.get("status") == 304
+
+    def update_validators(self) -> list[str]:
+        """
+        Copies the validators of the last response onto the feed.
+        Only a successful response has validators worth keeping,
+        after a 304 or a failed fetch the stored ones still apply.
+        Returns the names of the fields that changed.
+        """
+        changed = []
+        status = self.rss_data.get("status")
+        if status is None or not 200 <= status < 300:
+            return changed
+        etag = self.rss_data.get("etag", "")
+        if etag != self.etag:
+            self.etag = etag
+            changed.append("etag")
+        last_modified = self.rss_data.get("modified", "")
+        if last_modified != self.last_modified:
+            self.last_modified = last_modified
+            changed.append("last_modified")
+        return changed
+
 
 class Article(models.Model):
-    feed = models.ForeignKey(Feed, on_delete=models.CASCADE)
-    source_id = models.CharField(max_length=64, null=True)
+    # Indexed by the composite indexes below, which all lead with feed
+    feed = models.ForeignKey(Feed, on_delete=models.CASCADE, db_index=False)
+    # The entry's id/guid, or its link when it has neither
+    source_id = models.CharField(max_length=200)
     published_date = models.DateTimeField(db_index=True)
     url = models.URLField(max_length=200, db_index=True)
     image_url = models.URLField(max_length=200)
     title = models.CharField(max_length=64)
     num_words = models.IntegerField(null=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["feed", "source_id"], name="unique_feed_source_id"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["feed", "-published_date"], name="article_feed_date"),
+            models.Index(fields=["feed", "url"], name="article_feed_url"),
+        ]
+
+
+class ScrapeJob(models.Model):
+    """
+    Queue of articles whose page still needs scraping.
+    Rows are deleted once the article is scraped.
+    A null run_after means the job ran out of attempts.
+    """
+
+    article = models.OneToOneField(Article, on_delete=models.CASCADE)
+    run_after = models.DateTimeField(null=True, db_index=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.CharField(max_length=200, blank=True, default="")
+
+
+class ScrapeResult(models.Model):
+    """
+    What scraping found at a canonical url, see controllers.canonicalize_url.
+    Shared by every feed that links to the same page.
+    """
+
+    canonical_url = models.URLField(max_length=200, unique=True)
+    image_url = models.URLField(max_length=200)
+    num_words = models.IntegerField(null=True)
+    scraped_at = models.DateTimeField()
+
 
 class User(AbstractUser):
     wpm = models.IntegerField(default=AVERAGE_WPM)
     followed_feeds = models.ManyToManyField(Feed, related_name="followers")
 
 
+class TimelineEntry(models.Model):
+    """
+    An article in the timeline of a user who follows its feed.
+    Copies the article's published_date so a timeline page is one index range scan.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False
+    )
+    article = models.ForeignKey(Article, on_delete=models.CASCADE)
+    published_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "article"], name="unique_timeline_entry"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-published_date", "-article"],
+                name="timeline_user_date",
+            )
+        ]
+
+
 class ReadEvent(models.Model):
     user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=True
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False
     )
     article = models.ForeignKey(Article, on_delete=models.CASCADE, db_index=True)
-    read_at = models.DateTimeField(db_index=True)
+    read_at = models.DateTimeField()
+
+    class Meta:
+        # One row per article a user has read, stamped with the first read
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "article"], name="unique_read_event"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["user", "read_at"], name="readevent_user_read_at")
+        ]
+
+
+class ReadingRollup(models.Model):
+    """A user's reads per day and feed, kept up to date as reads come in"""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False
+    )
+    day = models.DateField()
+    feed = models.ForeignKey(Feed, on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "day", "feed"], name="unique_reading_rollup"
+            )
+        ]
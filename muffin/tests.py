@@ -1,3 +1,1460 @@
-from django.test import TestCase
+import gzip
+import io
+import itertools
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.parse
+from collections import Counter
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+import feedparser
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.forms.models import model_to_dict
+from django.test import TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from muffin.controllers import (
+    FeedPoller,
+    ResponseTooLarge,
+    UserdataFormatter,
+    apply_cached_scrapes,
+    build_search_triggers,
+    canonicalize_url,
+    claim_scrape_jobs,
+    construct_new_articles,
+    decode_cursor,
+    encode_cursor,
+    ensure_search_triggers,
+    estimate_poll_interval,
+    finish_scrape_job,
+    fill_daily_counts,
+    follow_feed,
+    get_quote,
+    ingest_articles,
+    iter_due_feeds,
+    load_bundled_quotes,
+    load_daily_read_counts,
+    load_feed_read_counts,
+    load_known_published_dates,
+    paginate_timeline,
+    prune_scrape_results,
+    rebuild_rollups,
+    schedule_next_poll,
+    scrape_article,
+    record_reads,
+    search_articles,
+    search_feeds,
+    unfollow_feed,
+)
+from muffin.constants import (
+    MAX_POLL_INTERVAL,
+    MIN_POLL_INTERVAL,
+    POLL_BACKOFF_FACTOR,
+    READ_BATCH_MAX_AGE,
+    SCRAPE_CACHE_TTL,
+    SCRAPE_LEASE,
+    SCRAPE_MAX_ATTEMPTS,
+    SCRAPE_RETRY_DELAY,
+    SEARCH_INDEXED_COLUMNS,
+    TIMELINE_VERSION_KEY,
+)
+from muffin.models import (
+    Article,
+    Feed,
+    ReadEvent,
+    ReadingRollup,
+    ScrapeJob,
+    ScrapeResult,
+    TimelineEntry,
+    User,
+)
+
+# Benchmarks report their measurements here, they only run with --tag benchmark
+logger = logging.getLogger(__name__)
+
+RSS_TEMPLATE = """<?xml version="1.0"?>
+<rss version="2.0">
+<channel>
+    <title>Feed</title>
+    <link>http://example.com</link>
+    <description>A feed</description>
+    {items}
+</channel>
+</rss>
+"""
+UNDATED_ITEM_TEMPLATE = """
+<item>
+    <title>Article {i}</title>
+    <link>http://example.com/{i}</link>
+    <guid>guid-{i}</guid>
+</item>
+"""
+
+
+def make_feed(num_undated_entries: int) -> Feed:
+    feed = Feed.objects.create(
+        title="Feed",
+        url=f"http://example.com/rss/{num_undated_entries}",
+        favicon_url="http://example.com/favicon.ico",
+    )
+    items = "".join(
+        UNDATED_ITEM_TEMPLATE.format(i=i) for i in range(num_undated_entries)
+    )
+    feed._rss_data = feedparser.parse(RSS_TEMPLATE.format(items=items))
+    return feed
+
+
+class PublishedDateLookupTests(TestCase):
+    def test_one_date_query_per_feed(self):
+        for num_entries in (1, 100):
+            feed = make_feed(num_entries)
+            # Existing article so the puller has a cutoff to compare against
+            ingest_articles(
+                feed,
+                [
+                    Article(
+                        feed=feed,
+                        source_id="guid-0",
+                        published_date=datetime(2020, 1, 1, tzinfo=timezone.utc),
+                        url="http://example.com/0",
+                    )
+                ],
+            )
+            # The cutoff is stored on the feed, so only the known dates are queried
+            with self.assertNumQueries(1):
+                construct_new_articles(feed)
+
+    def test_undated_entries_keep_stored_date(self):
+        feed = make_feed(3)
+        stored_date = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        ingest_articles(
+            feed,
+            [
+                Article(
+                    feed=feed,
+                    source_id="guid-1",
+                    published_date=stored_date,
+                    url="http://example.com/1",
+                )
+            ],
+        )
+        new_articles = construct_new_articles(feed)
+        self.assertEqual(
+            sorted(article.url for article in new_articles),
+            ["http://example.com/0", "http://example.com/2"],
+        )
+        self.assertTrue(all(a.published_date > stored_date for a in new_articles))
+
+
+class IngestTests(TestCase):
+    def setUp(self):
+        self.feed = Feed.objects.create(title="Feed", url="http://example.com/rss")
+
+    def make_articles(self, source_ids) -> list[Article]:
+        return [
+            Article(
+                feed=self.feed,
+                source_id=source_id,
+                url=f"http://example.com/{source_id}",
+                published_date=timezone.now(),
+            )
+            for source_id in source_ids
+        ]
+
+    def test_duplicates_are_not_inserted(self):
+        inserted = ingest_articles(self.feed, self.make_articles(["a", "b", "a"]))
+        self.assertEqual(sorted(a.source_id for a in inserted), ["a", "b"])
+        inserted = ingest_articles(self.feed, self.make_articles(["b", "c"]))
+        self.assertEqual([a.source_id for a in inserted], ["c"])
+        self.assertEqual(Article.objects.filter(feed=self.feed).count(), 3)
+        self.feed.refresh_from_db()
+        self.assertEqual(self.feed.article_count, 3)
+
+    def test_overlapping_poll_inserts_are_not_counted(self):
+        original = apply_cached_scrapes
+
+        def store_first(articles):
+            # Another poll commits "b" between the existence check and the insert
+            Article.objects.bulk_create(self.make_articles(["b"]))
+            return original(articles)
+
+        with mock.patch("muffin.controllers.apply_cached_scrapes", store_first):
+            inserted = ingest_articles(self.feed, self.make_articles(["a", "b"]))
+        self.assertEqual([a.source_id for a in inserted], ["a"])
+        self.assertTrue(all(a.pk for a in inserted))
+        self.feed.refresh_from_db()
+        self.assertEqual(self.feed.article_count, 1)
+
+
+def make_large_rss_data(url: str, *args) -> feedparser.FeedParserDict:
+    """A parsed feed whose entries carry about 100KB of content each"""
+    published = time.gmtime()
+    return feedparser.FeedParserDict(
+        bozo=False,
+        status=200,
+        feed={},
+        entries=[
+            feedparser.FeedParserDict(
+                id=f"{url}/{i}",
+                link=f"{url}/{i}",
+                title=f"Article {i}",
+                published_parsed=published,
+                summary="summary " * 1000,
+                content=[{"value": f"{url} content {i} " * 5000}],
+            )
+            for i in range(5)
+        ],
+    )
+
+
+class ValidatorTests(TestCase):
+    def setUp(self):
+        self.feed = Feed.objects.create(
+            title="Feed",
+            url="http://example.com/rss",
+            etag='"v1"',
+            last_modified="Mon, 01 Jan 2024 00:00:00 GMT",
+        )
+
+    def poll(self):
+        FeedPoller(max_workers=1).poll([Feed.objects.get(pk=self.feed.pk)])
+        return Feed.objects.get(pk=self.feed.pk)
+
+    def assertValidatorsKept(self, feed: Feed):
+        self.assertEqual(feed.etag, '"v1"')
+        self.assertEqual(feed.last_modified, "Mon, 01 Jan 2024 00:00:00 GMT")
+
+    def test_not_modified_keeps_validators(self):
+        not_modified = feedparser.FeedParserDict(
+            bozo=False, entries=[], feed={}, status=304
+        )
+        with mock.patch("muffin.controllers.fetch_rss_data", return_value=not_modified):
+            self.assertValidatorsKept(self.poll())
+
+    def test_failed_fetch_keeps_validators(self):
+        for error in (requests.ConnectionError(), ResponseTooLarge()):
+            with mock.patch("muffin.controllers.fetch", side_effect=error):
+                feed = self.poll()
+            self.assertValidatorsKept(feed)
+            self.assertTrue(feed.is_bozo)
+
+    def test_new_response_replaces_validators(self):
+        modified = feedparser.FeedParserDict(
+            bozo=False, entries=[], feed={}, status=200, etag='"v2"', modified=""
+        )
+        with mock.patch("muffin.controllers.fetch_rss_data", return_value=modified):
+            feed = self.poll()
+        self.assertEqual(feed.etag, '"v2"')
+        self.assertEqual(feed.last_modified, "")
+
+
+@tag("benchmark")
+@mock.patch("muffin.controllers.fetch_rss_data", make_large_rss_data)
+class PollMemoryBenchmark(TestCase):
+    def measure_peak(self, num_feeds: int) -> int:
+        Feed.objects.bulk_create(
+            Feed(title="Feed", url=f"http://example.com/{num_feeds}/{i}")
+            for i in range(num_feeds)
+        )
+        tracemalloc.start()
+        summary = FeedPoller(max_workers=4).poll(iter_due_feeds(chunk_size=20))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertEqual(summary.num_polled, num_feeds)
+        return peak
+
+    def test_peak_memory_is_flat_in_feed_count(self):
+        small_peak = self.measure_peak(20)
+        large_peak = self.measure_peak(200)
+        report = (
+            f"Peak poll memory: {small_peak / 2 ** 20:.1f}MiB for 20 feeds, "
+            f"{large_peak / 2 ** 20:.1f}MiB for 200 feeds"
+        )
+        logger.info(report)
+        # 10x the feeds, well under 2x the memory
+        self.assertLess(large_peak, 2 * small_peak, report)
+
+
+# A table read end to end, or a sort that the index order doesn't cover
+BAD_PLAN_PATTERN = re.compile(r"^SCAN \w+$|USE TEMP B-TREE FOR ORDER BY")
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+        "pages": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+    }
+)
+class QueryPlanTests(TestCase):
+    """
+    Runs the hot code paths against synthetic data
+    and checks the plan SQLite picks for every query they make.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.feeds = [
+            Feed.objects.create(title=f"Feed {i}", url=f"http://example.com/{i}")
+            for i in range(20)
+        ]
+        Article.objects.bulk_create(
+            Article(
+                feed=cls.feeds[i % len(cls.feeds)],
+                source_id=str(i),
+                url=f"http://example.com/articles/{i}",
+                published_date=now - timedelta(minutes=i),
+            )
+            for i in range(5000)
+        )
+        users = [
+            User.objects.create(username=f"reader{i}", email=f"reader{i}@example.com")
+            for i in range(10)
+        ]
+        cls.user = users[0]
+        for i, user in enumerate(users):
+            articles = list(Article.objects.filter(feed__in=cls.feeds[i : i + 5]))
+            TimelineEntry.objects.bulk_create(
+                TimelineEntry(
+                    user=user, article=article, published_date=article.published_date
+                )
+                for article in articles
+            )
+            ReadEvent.objects.bulk_create(
+                ReadEvent(user=user, article=article, read_at=article.published_date)
+                for article in articles[::3]
+            )
+        rebuild_rollups()
+        cls.cursor = encode_cursor(now - timedelta(minutes=2500), 2500)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertIndexedPlans(self, queries):
+        self.assertTrue(queries)
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query["sql"].startswith("SELECT"):
+                    continue
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                for *_, detail in cursor.fetchall():
+                    self.assertNotRegex(detail, BAD_PLAN_PATTERN, query["sql"])
+
+    def test_anonymous_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/muffin/", {"before": self.cursor})
+            self.client.get("/muffin/", {"after": self.cursor})
+        self.assertIndexedPlans(queries)
+
+    def test_user_timeline(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/muffin/", {"before": self.cursor})
+            self.client.get("/muffin/", {"after": self.cursor})
+        self.assertIndexedPlans(queries)
+
+    def test_poll_lookups(self):
+        feed = make_feed(10)
+        with CaptureQueriesContext(connection) as queries:
+            estimate_poll_interval(self.feeds[0])
+            load_known_published_dates(feed)
+        self.assertIndexedPlans(queries)
+
+    def test_stats(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/muffin/api/stats")
+        self.assertIndexedPlans(queries)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.feed = Feed.objects.create(
+            title="Muffin Recipes",
+            description="Baking every week",
+            url="http://example.com/rss",
+        )
+        ingest_articles(
+            self.feed,
+            [
+                Article(
+                    feed=self.feed,
+                    source_id=str(i),
+                    title=title,
+                    url=f"http://example.com/{i}",
+                    published_date=timezone.now(),
+                )
+                for i, title in enumerate(
+                    ["Blueberry muffins", "Muffins, muffins and more muffins", "Bread"]
+                )
+            ],
+        )
+
+    def test_prefix_match_ranked(self):
+        titles = [article.title for article in search_articles("muff")]
+        self.assertEqual(
+            titles, ["Muffins, muffins and more muffins", "Blueberry muffins"]
+        )
+        self.assertEqual(search_feeds("bak"), [self.feed])
+        self.assertEqual(search_articles("blueberry muf")[0].title, "Blueberry muffins")
+        # Only the last word is a prefix
+        self.assertEqual(search_articles("blue muf"), [])
+
+    def test_operators_are_literal(self):
+        self.assertEqual(search_articles('"'), [])
+        self.assertEqual(search_articles("bread OR NOT"), [])
+
+    def test_index_follows_writes(self):
+        article = Article.objects.get(title="Bread")
+        article.title = "Sourdough"
+        article.save()
+        self.assertEqual(search_articles("bread"), [])
+        self.assertEqual(search_articles("sour"), [article])
+        article.delete()
+        self.assertEqual(search_articles("sour"), [])
+        self.feed.title = "Scones"
+        self.feed.save()
+        self.assertEqual(search_feeds("muffin"), [])
+        self.assertEqual(search_feeds("scone"), [self.feed])
+
+    def test_triggers_exist(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            names = {name for name, in cursor.fetchall()}
+        for table, columns in SEARCH_INDEXED_COLUMNS.items():
+            self.assertLessEqual(set(build_search_triggers(table, columns)), names)
+
+    def test_dropped_triggers_are_recreated(self):
+        with connection.cursor() as cursor:
+            # What rebuilding the table for a schema change does
+            cursor.execute("DROP TRIGGER muffin_article_fts_insert")
+        article = Article.objects.create(
+            feed=self.feed,
+            source_id="scones",
+            title="Scones",
+            url="http://example.com/scones",
+            published_date=timezone.now(),
+        )
+        self.assertEqual(search_articles("scones"), [])
+        ensure_search_triggers()
+        self.assertEqual(search_articles("scones"), [article])
+        article.title = "Cheese scones"
+        article.save()
+        self.assertEqual(search_articles("cheese"), [article])
+        self.test_triggers_exist()
+
+    def test_endpoints(self):
+        response = self.client.get("/muffin/api/search", {"q": "blueberry"})
+        self.assertEqual(
+            [article["title"] for article in response.json()["articles"]],
+            ["Blueberry muffins"],
+        )
+        response = self.client.get("/muffin/search/", {"q": "muffin"})
+        self.assertContains(response, "Blueberry muffins")
+
+
+@tag("benchmark")
+class SearchBenchmark(TestCase):
+    def test_search_time(self):
+        feed = Feed.objects.create(title="Feed", url="http://example.com/rss")
+        words = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf"]
+        Article.objects.bulk_create(
+            (
+                Article(
+                    feed=feed,
+                    source_id=str(i),
+                    title=f"{words[i % 7]} {words[i // 7 % 7]} story {i}",
+                    url=f"http://example.com/{i}",
+                    published_date=timezone.now(),
+                )
+                for i in range(100000)
+            ),
+            batch_size=5000,
+        )
+        start = time.perf_counter()
+        for search_string in ("alpha", "del", "story 9999", "golf ec", "story"):
+            self.assertTrue(search_articles(search_string))
+        elapsed = (time.perf_counter() - start) / 5
+        report = f"Search over 100k articles: {elapsed * 1000:.1f}ms per query"
+        logger.info(report)
+        self.assertLess(elapsed, 0.05, report)
+
+
+class ReadStateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="reader", email="reader@example.com")
+        feed = Feed.objects.create(title="Feed", url="http://example.com/rss")
+        follow_feed(self.user, feed)
+        self.articles = ingest_articles(
+            feed,
+            [
+                Article(
+                    feed=feed,
+                    source_id=str(i),
+                    url=f"http://example.com/{i}",
+                    published_date=timezone.now() - timedelta(minutes=i),
+                )
+                for i in range(3)
+            ],
+        )
+        self.client.force_login(self.user)
+
+    def test_mark_read_is_idempotent(self):
+        for _ in range(3):
+            self.client.post("/muffin/api/mark_read/", {"article": self.articles[0].id})
+        self.assertEqual(ReadEvent.objects.filter(user=self.user).count(), 1)
+
+    def test_index_marks_read_articles(self):
+        self.client.post("/muffin/api/mark_read/", {"article": self.articles[1].id})
+        response = self.client.get("/muffin/")
+        self.assertContains(response, 'class="read"', count=1)
+        self.assertEqual(
+            [a.is_read for a in response.context["page_obj"].object_list],
+            [a.id == self.articles[1].id for a in self.articles],
+        )
+
+    def test_batch_mark_read(self):
+        now = timezone.now()
+        reads = [
+            {"article": self.articles[0].id, "read_at": now.isoformat()},
+            {
+                "article": self.articles[0].id,
+                "read_at": (now - timedelta(hours=1)).isoformat(),
+            },
+            {
+                "article": self.articles[1].id,
+                "read_at": (now + timedelta(days=1)).isoformat(),
+            },
+            {"article": 10**6, "read_at": now.isoformat()},
+        ]
+        # Session and user, then in a savepoint: the id and read state checks,
+        # the insert in a savepoint of its own, and creating and bumping the one
+        # rollup the reads fall in
+        with self.assertNumQueries(11):
+            response = self.client.post(
+                "/muffin/api/mark_read_batch/", {"reads": json.dumps(reads)}
+            )
+        self.assertEqual(response.status_code, 200)
+        read_at = dict(
+            ReadEvent.objects.filter(user=self.user).values_list(
+                "article_id", "read_at"
+            )
+        )
+        self.assertEqual(read_at[self.articles[0].id], now - timedelta(hours=1))
+        self.assertLessEqual(read_at[self.articles[1].id], timezone.now())
+        self.assertEqual(len(read_at), 2)
+
+    def test_batch_mark_read_rejects_bad_input(self):
+        now = timezone.now().isoformat()
+        for reads in (
+            "nope",
+            '{"article": 1}',
+            '[{"article": 1}]',
+            "[1]",
+            json.dumps([{"article": 10**30, "read_at": now}]),
+            json.dumps([{"article": -1, "read_at": now}]),
+        ):
+            response = self.client.post(
+                "/muffin/api/mark_read_batch/", {"reads": reads}
+            )
+            self.assertEqual(response.status_code, 400, reads)
+
+    def test_batch_mark_read_clamps_backdated_reads(self):
+        reads = [{"article": self.articles[0].id, "read_at": "1900-01-01T00:00:00Z"}]
+        before = timezone.now()
+        self.client.post("/muffin/api/mark_read_batch/", {"reads": json.dumps(reads)})
+        read_at = ReadEvent.objects.get(user=self.user).read_at
+        self.assertGreaterEqual(read_at, before - READ_BATCH_MAX_AGE)
+        (rollup,) = ReadingRollup.objects.filter(user=self.user)
+        self.assertGreaterEqual(
+            rollup.day, timezone.localdate(before - READ_BATCH_MAX_AGE)
+        )
+
+
+def make_read_history(user: User, num_events: int, num_feeds: int) -> None:
+    """One read per article, a few per day going back from today"""
+    feeds = [
+        Feed.objects.create(title=f"Feed {i}", url=f"http://example.com/{user.pk}/{i}")
+        for i in range(num_feeds)
+    ]
+    now = timezone.now()
+    Article.objects.bulk_create(
+        (
+            Article(
+                feed=feeds[i % num_feeds],
+                source_id=str(i),
+                url=f"http://example.com/{user.pk}/articles/{i}",
+                published_date=now,
+            )
+            for i in range(num_events)
+        ),
+        batch_size=5000,
+    )
+    ReadEvent.objects.bulk_create(
+        (
+            ReadEvent(
+                user=user, article_id=article_id, read_at=now - timedelta(hours=i)
+            )
+            for i, article_id in enumerate(
+                Article.objects.filter(feed__in=feeds)
+                .order_by("id")
+                .values_list("id", flat=True)
+            )
+        ),
+        batch_size=5000,
+    )
+    rebuild_rollups(user)
+
+
+class StatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="reader", email="reader@example.com")
+        self.client.force_login(self.user)
+
+    def test_counts(self):
+        make_read_history(self.user, 4, 2)
+        # A gap of a day in the middle of the history
+        ReadEvent.objects.filter(article__source_id="3").update(
+            read_at=timezone.now() - timedelta(days=3)
+        )
+        rebuild_rollups(self.user)
+        today = timezone.now().date()
+        daily_counts = load_daily_read_counts(self.user)
+        self.assertEqual(sum(daily_counts.values()), 4)
+        days, counts = fill_daily_counts(daily_counts, today - timedelta(days=3), today)
+        self.assertEqual(len(days), 4)
+        self.assertEqual(sum(counts), 4)
+        self.assertIn(0, counts)
+        self.assertEqual(
+            sorted(load_feed_read_counts(self.user)), [("Feed 0", 2), ("Feed 1", 2)]
+        )
+        since = timezone.localdate() - timedelta(days=1)
+        self.assertEqual(sum(load_daily_read_counts(self.user, since).values()), 3)
+
+    def test_windows(self):
+        for url in ("/muffin/stats/", "/muffin/api/stats"):
+            for query in ({}, {"days": 7}):
+                self.assertEqual(self.client.get(url, query).status_code, 200)
+            for days in ("0", "week", "8", "1000000", str(10**10)):
+                self.assertEqual(self.client.get(url, {"days": days}).status_code, 404)
+
+    def test_payload(self):
+        make_read_history(self.user, 4, 2)
+        payload = self.client.get("/muffin/api/stats", {"days": 7}).json()
+        self.assertEqual(
+            payload["start"], (timezone.localdate() - timedelta(days=6)).isoformat()
+        )
+        self.assertEqual(len(payload["counts"]), 7)
+        self.assertEqual(sum(payload["counts"]), 4)
+        self.assertEqual(sorted(payload["feeds"]), ["Feed 0", "Feed 1"])
+        self.assertEqual(payload["feed_counts"], [2, 2])
+
+    def test_revalidation(self):
+        make_read_history(self.user, 4, 2)
+        response = self.client.get("/muffin/api/stats")
+        etag = response["ETag"]
+        response = self.client.get("/muffin/api/stats", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            "/muffin/api/stats", {"days": 7}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        article = Article.objects.create(
+            feed=Feed.objects.first(),
+            source_id="new",
+            url="http://example.com/new",
+            published_date=timezone.now(),
+        )
+        # Read times can come in earlier than the last read, the etag still moves
+        record_reads(self.user, {article.id: timezone.now() - timedelta(days=30)})
+        response = self.client.get("/muffin/api/stats", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+@tag("benchmark")
+class StatsBenchmark(TestCase):
+    def test_stats_time(self):
+        user = User.objects.create(username="reader", email="reader@example.com")
+        make_read_history(user, 100000, 50)
+        self.client.force_login(user)
+        for query in ({}, {"days": 30}):
+            start = time.perf_counter()
+            response = self.client.get("/muffin/api/stats", query)
+            elapsed = time.perf_counter() - start
+            self.assertEqual(response.status_code, 200)
+            report = f"Stats for 100k reads {query}: {elapsed * 1000:.0f}ms"
+            logger.info(report)
+            self.assertLess(elapsed, 2, report)
+
+
+class RollupTests(TestCase):
+    def test_reads_update_rollups(self):
+        user = User.objects.create(username="reader", email="reader@example.com")
+        make_read_history(user, 10, 3)
+        self.client.force_login(user)
+        feed = Feed.objects.create(title="New", url="http://example.com/new")
+        articles = [
+            Article.objects.create(
+                feed=feed,
+                source_id=str(i),
+                url=f"http://example.com/new/{i}",
+                published_date=timezone.now(),
+            )
+            for i in range(3)
+        ]
+        self.client.post("/muffin/api/mark_read/", {"article": articles[0].id})
+        self.client.post("/muffin/api/mark_read/", {"article": articles[0].id})
+        reads = [
+            {"article": article.id, "read_at": timezone.now().isoformat()}
+            for article in articles
+        ]
+        self.client.post("/muffin/api/mark_read_batch/", {"reads": json.dumps(reads)})
+
+        def rollups():
+            return sorted(ReadingRollup.objects.values_list("day", "feed_id", "count"))
+
+        incremental = rollups()
+        self.assertIn((timezone.localdate(), feed.id, 3), incremental)
+        call_command("rebuild_rollups", stdout=io.StringIO())
+        self.assertEqual(rollups(), incremental)
+        self.assertEqual(sum(load_daily_read_counts(user).values()), 13)
+
+    def test_concurrent_duplicate_is_not_counted(self):
+        user = User.objects.create(username="reader", email="reader@example.com")
+        feed = Feed.objects.create(title="Feed", url="http://example.com/rss")
+        articles = [
+            Article.objects.create(
+                feed=feed,
+                source_id=str(i),
+                url=f"http://example.com/{i}",
+                published_date=timezone.now(),
+            )
+            for i in range(2)
+        ]
+        record_reads(user, {articles[0].id: timezone.now()})
+        # Another request stores the read after this one checked for it
+        no_reads = ReadEvent.objects.none()
+        with mock.patch.object(ReadEvent.objects, "filter", return_value=no_reads):
+            inserted = record_reads(
+                user, {article.id: timezone.now() for article in articles}
+            )
+        self.assertEqual([event.article_id for event in inserted], [articles[1].id])
+        self.assertEqual(ReadEvent.objects.filter(user=user).count(), 2)
+        self.assertEqual(
+            list(ReadingRollup.objects.values_list("count", flat=True)), [2]
+        )
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="reader", email="reader@example.com")
+        make_read_history(self.user, 5, 2)
+        follow_feed(self.user, Feed.objects.first())
+        self.client.force_login(self.user)
+
+    def expected_export(self) -> dict:
+        """What the export held when it was built as one dict"""
+        return {
+            "user": model_to_dict(
+                self.user,
+                fields=[
+                    "last_login",
+                    "is_superuser",
+                    "username",
+                    "email",
+                    "is_active",
+                    "date_joined",
+                    "wpm",
+                ],
+            ),
+            "followed_feeds": [
+                model_to_dict(feed) for feed in self.user.followed_feeds.all()
+            ],
+            "read_events": [
+                {
+                    "read_at": read_event.read_at.isoformat(),
+                    "article": model_to_dict(read_event.article),
+                }
+                for read_event in self.user.readevent_set.select_related("article")
+            ],
+        }
+
+    def test_same_shape(self):
+        expected = json.loads(json.dumps(self.expected_export(), cls=DjangoJSONEncoder))
+        # Chunks smaller than the history to cover the joins between them
+        content = "".join(UserdataFormatter(self.user, chunk_size=2).iter_json())
+        self.assertEqual(json.loads(content), expected)
+        response = self.client.get("/muffin/download_data/")
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), expected)
+        response = self.client.get("/muffin/download_data/", {"gzip": 1})
+        self.assertEqual(
+            json.loads(gzip.decompress(b"".join(response.streaming_content))),
+            expected,
+        )
+
+
+@tag("benchmark")
+class ExportMemoryBenchmark(TestCase):
+    def measure_peak(self, num_events: int) -> int:
+        user = User.objects.create(
+            username=f"reader{num_events}", email=f"reader{num_events}@example.com"
+        )
+        make_read_history(user, num_events, 10)
+        tracemalloc.start()
+        for _ in UserdataFormatter(user).iter_json():
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
+
+    def test_peak_memory_is_flat_in_history_size(self):
+        small_peak = self.measure_peak(5000)
+        large_peak = self.measure_peak(50000)
+        report = (
+            f"Peak export memory: {small_peak / 2 ** 20:.1f}MiB for 5k reads, "
+            f"{large_peak / 2 ** 20:.1f}MiB for 50k reads"
+        )
+        logger.info(report)
+        self.assertLess(large_peak, 2 * small_peak, report)
+
+
+def import_views_with_timings() -> dict[str, int]:
+    """
+    Imports muffin.views in a fresh interpreter under -X importtime.
+    Returns the cumulative import time in microseconds of every module it loaded.
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import django; django.setup(); import muffin.views",
+        ],
+        cwd=settings.BASE_DIR,
+        env={**os.environ, "DJANGO_SETTINGS_MODULE": "app.settings"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, module = line.removeprefix("import time:").split("|")
+        timings[module.strip()] = int(cumulative)
+    return timings
+
+
+class ImportTests(TestCase):
+    def test_views_skip_heavy_dependencies(self):
+        loaded = import_views_with_timings()
+        for module in ("requests", "feedfinder2", "newspaper", "plotly", "pandas"):
+            self.assertNotIn(module, loaded)
+
+
+@tag("benchmark")
+class ImportTimeBenchmark(TestCase):
+    # Time a fresh worker may spend importing muffin.views, Django's own setup aside
+    BUDGET_US = 200_000
+
+    def test_views_import_time(self):
+        # The fastest of a few runs, to keep a busy machine from failing the check
+        elapsed = min(import_views_with_timings()["muffin.views"] for _ in range(3))
+        report = f"Importing muffin.views: {elapsed / 1000:.0f}ms"
+        logger.info(report)
+        self.assertLess(elapsed, self.BUDGET_US, report)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+@mock.patch("muffin.controllers._quote_index", None)
+class QuoteTests(TestCase):
+    def test_no_network_on_request(self):
+        with mock.patch("muffin.controllers.fetch", side_effect=AssertionError):
+            for _ in range(20):
+                self.assertGreaterEqual(len(get_quote(300)["content"]), 300)
+            # Nothing is that long, the longest quote is the best there is
+            longest = get_quote(10**6)
+            self.assertEqual(
+                longest["content"], load_bundled_quotes().quotes[-1]["content"]
+            )
+
+    def test_refreshed_quotes_replace_bundled(self):
+        quote = {"content": "x" * 400, "author": "Someone", "tags": []}
+        resp = mock.Mock(status_code=200)
+        resp.json.return_value = {"results": [quote], "totalPages": 1}
+        with mock.patch("muffin.controllers.fetch", return_value=resp):
+            call_command("refresh_quotes", stdout=io.StringIO())
+        self.assertEqual(
+            get_quote(250), {"content": quote["content"], "author": "Someone"}
+        )
+        # Too short for any fetched quote, the bundled ones fill in
+        self.assertIn(get_quote(450), load_bundled_quotes().quotes)
+
+
+class ScrapeJobTests(TestCase):
+    def setUp(self):
+        feed = Feed.objects.create(title="Feed", url="http://example.com/rss")
+        self.article = Article.objects.create(
+            feed=feed,
+            source_id="a",
+            url="http://example.com/a",
+            published_date=timezone.now(),
+        )
+        self.job = ScrapeJob.objects.create(
+            article=self.article, run_after=timezone.now() - timedelta(seconds=1)
+        )
+
+    def test_claim_leases_the_job(self):
+        (job,) = claim_scrape_jobs(10)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now() + SCRAPE_LEASE / 2)
+        # Leased, so no other worker gets it
+        self.assertEqual(claim_scrape_jobs(10), [])
+        # Until the lease runs out
+        ScrapeJob.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([job.pk for job in claim_scrape_jobs(10)], [self.job.pk])
+
+    def test_failures_back_off(self):
+        for attempt in (1, 2, 3):
+            (job,) = claim_scrape_jobs(10)
+            before = timezone.now()
+            finish_scrape_job(job, None, "boom")
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            self.assertEqual(job.last_error, "boom")
+            delay = job.run_after - before
+            expected = SCRAPE_RETRY_DELAY * 2 ** (attempt - 1)
+            self.assertAlmostEqual(
+                delay.total_seconds(), expected.total_seconds(), delta=5
+            )
+            ScrapeJob.objects.update(run_after=timezone.now())
+
+    def test_gives_up_after_max_attempts(self):
+        ScrapeJob.objects.update(attempts=SCRAPE_MAX_ATTEMPTS - 1)
+        (job,) = claim_scrape_jobs(10)
+        finish_scrape_job(job, None, "boom")
+        job.refresh_from_db()
+        self.assertIsNone(job.run_after)
+        self.assertEqual(claim_scrape_jobs(10), [])
+
+    def test_success_stores_the_result(self):
+        (job,) = claim_scrape_jobs(10)
+        finish_scrape_job(job, ("http://example.com/a.png", 300), "")
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.num_words, 300)
+        self.assertFalse(ScrapeJob.objects.exists())
+        result = ScrapeResult.objects.get()
+        self.assertEqual(result.canonical_url, "https://example.com/a")
+        self.assertEqual(result.num_words, 300)
+
+    def test_article_deleted_while_scraping(self):
+        (job,) = claim_scrape_jobs(10)
+        self.article.delete()
+        finish_scrape_job(job, None, "boom")
+        finish_scrape_job(job, ("http://example.com/a.png", 300), "")
+        self.assertFalse(Article.objects.exists())
+        self.assertFalse(ScrapeJob.objects.exists())
+
+
+class CanonicalizeUrlTests(TestCase):
+    def test_equivalent_urls_match(self):
+        canonical = canonicalize_url("https://example.com/post?id=1&page=2")
+        for url in (
+            "http://example.com/post?id=1&page=2",
+            "https://www.example.com/post?id=1&page=2",
+            "https://EXAMPLE.com:443/post?page=2&id=1",
+            "https://example.com/post?id=1&page=2&utm_source=rss&fbclid=x",
+            " https://example.com/post?id=1&page=2#comments ",
+        ):
+            self.assertEqual(canonicalize_url(url), canonical, url)
+
+    def test_different_pages_differ(self):
+        self.assertNotEqual(
+            canonicalize_url("https://example.com/post?id=1"),
+            canonicalize_url("https://example.com/post?id=2"),
+        )
+        self.assertNotEqual(
+            canonicalize_url("https://example.com/post"),
+            canonicalize_url("https://example.com:8080/post"),
+        )
+        self.assertEqual(canonicalize_url("http://example.com"), "https://example.com/")
+
+    def test_unparseable_urls_are_kept(self):
+        for url in ("http://example.com:abc/", "http://example.com:99999/"):
+            self.assertEqual(canonicalize_url(url), url)
+
+
+class ScrapeCacheTests(TestCase):
+    def setUp(self):
+        self.feeds = [
+            Feed.objects.create(title=f"Feed {i}", url=f"http://example.com/rss/{i}")
+            for i in range(2)
+        ]
+
+    def ingest(self, feed, url):
+        (article,) = ingest_articles(
+            feed,
+            [Article(feed=feed, source_id=url, url=url, published_date=timezone.now())],
+        )
+        return article
+
+    def test_other_feeds_reuse_scrapes(self):
+        self.ingest(self.feeds[0], "http://example.com/post?utm_source=rss")
+        (job,) = claim_scrape_jobs(10)
+        finish_scrape_job(job, ("http://example.com/post.png", 300), "")
+        article = self.ingest(self.feeds[1], "https://www.example.com/post")
+        self.assertEqual(article.image_url, "http://example.com/post.png")
+        self.assertEqual(article.num_words, 300)
+        self.assertFalse(ScrapeJob.objects.exists())
+
+    def test_stale_results_are_not_used(self):
+        ScrapeResult.objects.create(
+            canonical_url="https://example.com/post",
+            image_url="http://example.com/post.png",
+            num_words=300,
+            scraped_at=timezone.now() - SCRAPE_CACHE_TTL - timedelta(minutes=1),
+        )
+        article = self.ingest(self.feeds[0], "https://example.com/post")
+        self.assertIsNone(article.num_words)
+        self.assertTrue(ScrapeJob.objects.filter(article=article).exists())
+        self.assertEqual(prune_scrape_results(), 1)
+        self.assertFalse(ScrapeResult.objects.exists())
+
+    def test_unparseable_urls_are_scraped(self):
+        for url in ("http://example.com:abc/", "http://example.com:99999/"):
+            article = self.ingest(self.feeds[0], url)
+            self.assertTrue(ScrapeJob.objects.filter(article=article).exists())
+
+
+@mock.patch("muffin.controllers.fetch_rss_data", make_large_rss_data)
+class PollTriggerTests(TestCase):
+    def test_staff_only_post(self):
+        Feed.objects.create(title="Feed", url="http://example.com/rss")
+        self.assertEqual(self.client.get("/muffin/api/poll_rss/").status_code, 405)
+        self.assertEqual(self.client.post("/muffin/api/poll_rss/").status_code, 403)
+        staff = User.objects.create(
+            username="staff", email="staff@example.com", is_staff=True
+        )
+        self.client.force_login(staff)
+        response = self.client.post("/muffin/api/poll_rss/")
+        self.assertEqual(response.json()["num_polled"], 1)
+
+    def test_stop_stops_pulling_feeds(self):
+        pulled = []
+
+        def feeds():
+            for i in range(100):
+                feed = Feed.objects.create(title="Feed", url=f"http://example.com/{i}")
+                pulled.append(feed)
+                yield feed
+
+        poller = FeedPoller(max_workers=2)
+        for report in poller.iter_poll(feeds()):
+            poller.stop()
+        # Only what was in flight when the poller stopped
+        self.assertLessEqual(len(pulled), 4)
+
+
+class FeedPollerTests(TestCase):
+    def setUp(self):
+        # A run of feeds on one host ahead of the others, as pk order gives
+        for host, num_feeds in (("a.example.com", 10), ("b.example.com", 5)):
+            for i in range(num_feeds):
+                Feed.objects.create(title="Feed", url=f"http://{host}/{i}")
+        self.lock = threading.Lock()
+        self.fetching = Counter()
+        self.max_fetching = Counter()
+        self.started = []
+
+    def fetch_rss_data(self, url: str, *args) -> feedparser.FeedParserDict:
+        host = urllib.parse.urlparse(url).netloc
+        with self.lock:
+            self.started.append(host)
+            self.fetching[host] += 1
+            self.fetching["all"] += 1
+            for key in (host, "all"):
+                self.max_fetching[key] = max(self.max_fetching[key], self.fetching[key])
+        time.sleep(0.02)
+        with self.lock:
+            self.fetching[host] -= 1
+            self.fetching["all"] -= 1
+        return make_large_rss_data(url)
+
+    def poll(self, poller: FeedPoller) -> tuple[list, list]:
+        """What the poll stored, rolled back afterwards"""
+        with mock.patch("muffin.controllers.fetch_rss_data", self.fetch_rss_data):
+            with transaction.atomic():
+                poller.poll(iter_due_feeds())
+                stored = (
+                    sorted(Article.objects.values_list("feed__url", "source_id")),
+                    sorted(Feed.objects.values_list("url", "article_count")),
+                )
+                transaction.set_rollback(True)
+        return stored
+
+    def test_limits_are_respected(self):
+        self.poll(FeedPoller(max_workers=4, max_per_host=2))
+        self.assertEqual(self.max_fetching["a.example.com"], 2)
+        self.assertEqual(self.max_fetching["b.example.com"], 2)
+        self.assertEqual(self.max_fetching["all"], 4)
+        # The second host didn't queue up behind the first one's run of feeds
+        self.assertEqual(
+            sorted(self.started[:4]), ["a.example.com"] * 2 + ["b.example.com"] * 2
+        )
+
+    def test_matches_serial_poll(self):
+        self.assertEqual(
+            self.poll(FeedPoller(max_workers=4, max_per_host=2)),
+            self.poll(FeedPoller(max_workers=1, max_per_host=1)),
+        )
+
+    def test_waiting_feeds_are_skipped_once_stopped(self):
+        poller = FeedPoller(max_workers=4, max_per_host=2)
+        with mock.patch("muffin.controllers.fetch_rss_data", self.fetch_rss_data):
+            reports = []
+            for report in poller.iter_poll(iter_due_feeds()):
+                reports.append(report)
+                poller.stop()
+        polled = [report.feed for report in reports if not report.skipped]
+        skipped = [report.feed for report in reports if report.skipped]
+        # What was fetching, plus the feed the first finished fetch handed
+        # its host slot to if it finished before a fetch on the other host
+        self.assertIn(len(polled), (4, 5))
+        # The rest of the first host's run waited for a slot and stays due
+        self.assertEqual(len(polled) + len(skipped), 12)
+        due = list(iter_due_feeds())
+        self.assertEqual(len(due), Feed.objects.count() - len(polled))
+        self.assertLessEqual(set(skipped), set(due))
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create(username=f"reader{i}", email=f"reader{i}@example.com")
+            for i in range(2)
+        ]
+        self.feeds = [
+            Feed.objects.create(title=f"Feed {i}", url=f"http://example.com/rss/{i}")
+            for i in range(2)
+        ]
+
+    def ingest(self, feed, source_ids) -> list[Article]:
+        return ingest_articles(
+            feed,
+            [
+                Article(
+                    feed=feed,
+                    source_id=source_id,
+                    url=f"{feed.url}/{source_id}",
+                    published_date=timezone.now(),
+                )
+                for source_id in source_ids
+            ],
+        )
+
+    def timeline(self, user) -> list[int]:
+        return sorted(
+            TimelineEntry.objects.filter(user=user).values_list("article_id", flat=True)
+        )
+
+    def test_ingest_fans_out_to_followers(self):
+        follow_feed(self.users[0], self.feeds[0])
+        follow_feed(self.users[1], self.feeds[1])
+        articles = self.ingest(self.feeds[0], ["a", "b"])
+        self.assertEqual(self.timeline(self.users[0]), [a.pk for a in articles])
+        self.assertEqual(self.timeline(self.users[1]), [])
+        entry = TimelineEntry.objects.get(user=self.users[0], article=articles[0])
+        self.assertEqual(entry.published_date, articles[0].published_date)
+
+    def test_follow_backfills(self):
+        articles = self.ingest(self.feeds[0], ["a", "b"])
+        self.ingest(self.feeds[1], ["c"])
+        follow_feed(self.users[0], self.feeds[0])
+        self.assertEqual(self.timeline(self.users[0]), [a.pk for a in articles])
+        self.assertEqual(self.timeline(self.users[1]), [])
+
+    def test_unfollow_prunes_only_that_feed(self):
+        for feed in self.feeds:
+            follow_feed(self.users[0], feed)
+        follow_feed(self.users[1], self.feeds[0])
+        self.ingest(self.feeds[0], ["a"])
+        kept = self.ingest(self.feeds[1], ["b"])
+        unfollow_feed(self.users[0], self.feeds[0])
+        self.assertEqual(self.timeline(self.users[0]), [kept[0].pk])
+        self.assertEqual(len(self.timeline(self.users[1])), 1)
+        self.assertEqual(list(self.users[0].followed_feeds.all()), [self.feeds[1]])
+
+    def test_refollow_does_not_duplicate(self):
+        follow_feed(self.users[0], self.feeds[0])
+        articles = self.ingest(self.feeds[0], ["a", "b"])
+        follow_feed(self.users[0], self.feeds[0])
+        self.assertEqual(self.timeline(self.users[0]), [a.pk for a in articles])
+        unfollow_feed(self.users[0], self.feeds[0])
+        follow_feed(self.users[0], self.feeds[0])
+        later = self.ingest(self.feeds[0], ["c"])
+        self.assertEqual(self.timeline(self.users[0]), [a.pk for a in articles + later])
+
+
+class PollScheduleTests(TestCase):
+    def setUp(self):
+        self.feed = Feed.objects.create(title="Feed", url="http://example.com/rss")
+
+    def add_articles(self, gap: timedelta, num_articles: int) -> None:
+        now = timezone.now()
+        Article.objects.bulk_create(
+            Article(
+                feed=self.feed,
+                source_id=str(i),
+                url=f"http://example.com/{i}",
+                published_date=now - gap * i,
+            )
+            for i in range(num_articles)
+        )
+
+    def test_estimate_is_median_gap(self):
+        self.assertEqual(estimate_poll_interval(self.feed), MIN_POLL_INTERVAL)
+        self.add_articles(timedelta(hours=1), 5)
+        # One outlier doesn't move the median
+        Article.objects.filter(source_id="4").update(
+            published_date=timezone.now() - timedelta(days=30)
+        )
+        self.assertEqual(estimate_poll_interval(self.feed), timedelta(hours=1))
+
+    def test_estimate_is_clamped(self):
+        self.add_articles(timedelta(seconds=10), 5)
+        self.assertEqual(estimate_poll_interval(self.feed), MIN_POLL_INTERVAL)
+        Article.objects.all().delete()
+        self.add_articles(timedelta(days=7), 5)
+        self.assertEqual(estimate_poll_interval(self.feed), MAX_POLL_INTERVAL)
+
+    def test_quiet_feeds_back_off_geometrically(self):
+        intervals = []
+        for _ in range(12):
+            schedule_next_poll(self.feed, 0)
+            intervals.append(self.feed.poll_interval)
+        self.assertEqual(intervals[0], MIN_POLL_INTERVAL * POLL_BACKOFF_FACTOR)
+        self.assertEqual(intervals[1], intervals[0] * POLL_BACKOFF_FACTOR)
+        self.assertEqual(intervals[-1], MAX_POLL_INTERVAL)
+        self.assertAlmostEqual(
+            self.feed.next_poll_at,
+            timezone.now() + MAX_POLL_INTERVAL,
+            delta=timedelta(seconds=5),
+        )
+
+    def test_new_articles_reset_to_cadence(self):
+        self.feed.poll_interval = MAX_POLL_INTERVAL
+        self.add_articles(timedelta(hours=2), 5)
+        changed = schedule_next_poll(self.feed, 1)
+        self.assertEqual(changed, ["poll_interval", "next_poll_at"])
+        self.assertEqual(self.feed.poll_interval, timedelta(hours=2))
+
+    def test_due_feeds(self):
+        now = timezone.now()
+        feeds = [self.feed] + [
+            Feed.objects.create(title="Feed", url=f"http://example.com/rss/{i}")
+            for i in range(4)
+        ]
+        next_polls = [None, now - timedelta(minutes=1), now + timedelta(hours=1)]
+        for feed, next_poll_at in zip(feeds, itertools.cycle(next_polls)):
+            Feed.objects.filter(pk=feed.pk).update(next_poll_at=next_poll_at)
+        due = [feeds[0], feeds[1], feeds[3], feeds[4]]
+        for chunk_size in (1, 2, 500):
+            self.assertEqual(list(iter_due_feeds(chunk_size)), due)
+
+    @mock.patch("muffin.controllers.fetch_rss_data", make_large_rss_data)
+    def test_failed_feeds_back_off(self):
+        with mock.patch(
+            "muffin.controllers.construct_new_articles",
+            side_effect=RuntimeError("boom"),
+        ):
+            summary = FeedPoller().poll(iter_due_feeds())
+        self.assertEqual(summary.num_errors, 1)
+        self.feed.refresh_from_db()
+        self.assertGreater(self.feed.next_poll_at, timezone.now())
+        self.assertEqual(list(iter_due_feeds()), [])
+
+
+class ScrapeArticleTests(TestCase):
+    def test_only_the_page_is_fetched(self):
+        html = """<html><body><article><p>{}</p>
+        <img src="http://example.com/inline.png"></article></body></html>""".format(
+            "Words in the article body. " * 50
+        )
+        page = mock.Mock(text=html)
+        with mock.patch(
+            "muffin.controllers.fetch", return_value=page
+        ) as fetch, mock.patch("requests.get") as get, mock.patch(
+            "requests.Session.request"
+        ) as request:
+            image_url, num_words = scrape_article("http://example.com/a")
+        fetch.assert_called_once_with("http://example.com/a")
+        get.assert_not_called()
+        request.assert_not_called()
+        self.assertEqual(image_url, "http://example.com/inline.png")
+        self.assertGreater(num_words, 100)
+
+
+class CursorTests(TestCase):
+    def test_round_trip(self):
+        published_date = timezone.now()
+        self.assertEqual(
+            decode_cursor(encode_cursor(published_date, 42)), (published_date, 42)
+        )
+
+    def walk(self, query, pk_field: str = "pk") -> tuple[list, list]:
+        """Every page going older with before, then back newer with after"""
+        page = paginate_timeline(query, page_size=5, pk_field=pk_field)
+        older = [page.object_list]
+        while page.older_cursor is not None:
+            page = paginate_timeline(
+                query, before=page.older_cursor, page_size=5, pk_field=pk_field
+            )
+            older.append(page.object_list)
+        newer = [page.object_list]
+        while page.newer_cursor is not None:
+            page = paginate_timeline(
+                query, after=page.newer_cursor, page_size=5, pk_field=pk_field
+            )
+            newer.append(page.object_list)
+        return older, newer[::-1]
+
+    def test_walk_over_shared_dates(self):
+        feed = Feed.objects.create(title="Feed", url="http://example.com/rss")
+        user = User.objects.create(username="reader", email="reader@example.com")
+        follow_feed(user, feed)
+        now = timezone.now()
+        # Runs of four articles published at the same moment straddle the pages
+        articles = ingest_articles(
+            feed,
+            [
+                Article(
+                    feed=feed,
+                    source_id=str(i),
+                    url=f"http://example.com/{i}",
+                    published_date=now - timedelta(minutes=i // 4),
+                )
+                for i in range(23)
+            ],
+        )
+        expected = sorted(
+            articles, key=lambda a: (a.published_date, a.pk), reverse=True
+        )
+        for query, pk_field, to_article in (
+            (Article.objects.all(), "pk", lambda article: article),
+            (
+                TimelineEntry.objects.filter(user=user).select_related("article"),
+                "article_id",
+                lambda entry: entry.article,
+            ),
+        ):
+            older, newer = self.walk(query, pk_field)
+            self.assertEqual(newer, older)
+            self.assertEqual([len(page) for page in older], [5, 5, 5, 5, 3])
+            walked = [to_article(row) for page in older for row in page]
+            self.assertEqual(walked, expected)
+
+    def test_bad_cursors_are_not_found(self):
+        published_date = timezone.now()
+        for cursor in (
+            "not a cursor",
+            encode_cursor(published_date, 10**30),
+            encode_cursor(published_date, -1),
+        ):
+            for param in ("before", "after"):
+                response = self.client.get("/muffin/", {param: cursor})
+                self.assertEqual(response.status_code, 404, cursor)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "default",
+        },
+        "pages": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "pages",
+        },
+    }
+)
+class AnonymousIndexCacheTests(TransactionTestCase):
+    """Writes have to commit here, the version is bumped in on_commit callbacks"""
+
+    def setUp(self):
+        caches["default"].clear()
+        caches["pages"].clear()
+        self.feed = Feed.objects.create(title="Feed", url="http://example.com/rss")
+        self.article = Article.objects.create(
+            feed=self.feed,
+            source_id="a",
+            url="http://example.com/a",
+            title="First",
+            published_date=timezone.now() - timedelta(hours=1),
+        )
+
+    def add_article(self, title):
+        return Article(
+            feed=self.feed,
+            source_id=title,
+            url=f"http://example.com/{title}",
+            title=title,
+            published_date=timezone.now(),
+        )
+
+    def test_pages_are_cached(self):
+        self.assertContains(self.client.get("/muffin/"), "First")
+        Article.objects.update(title="Renamed")
+        self.assertContains(self.client.get("/muffin/"), "First")
+
+    def test_ingestion_refreshes_pages(self):
+        self.assertNotContains(self.client.get("/muffin/"), "Second")
+        ingest_articles(self.feed, [self.add_article("Second")])
+        self.assertContains(self.client.get("/muffin/"), "Second")
+
+    def test_scraping_refreshes_pages(self):
+        job = ScrapeJob.objects.create(article=self.article, run_after=timezone.now())
+        self.assertNotContains(self.client.get("/muffin/"), "4 min")
+        finish_scrape_job(job, ("http://example.com/a.png", 1000), "")
+        self.assertContains(self.client.get("/muffin/"), "4 min")
+
+    def test_cursor_spellings_share_a_page(self):
+        published_date = self.article.published_date + timedelta(minutes=1)
+        cursor = encode_cursor(published_date, 10**6)
+        same = encode_cursor(
+            published_date.astimezone(timezone.get_fixed_timezone(120)), 10**6
+        )
+        self.assertNotEqual(cursor, same)
+        self.assertContains(self.client.get("/muffin/", {"before": cursor}), "First")
+        Article.objects.update(title="Renamed")
+        self.assertContains(self.client.get("/muffin/", {"before": same}), "First")
+
+    def test_bad_cursors_are_not_cached(self):
+        with mock.patch.object(caches["pages"], "set") as cache_set:
+            response = self.client.get("/muffin/", {"before": "junk"})
+        self.assertEqual(response.status_code, 404)
+        cache_set.assert_not_called()
+
+    def test_evicted_version_does_not_revive_pages(self):
+        self.client.get("/muffin/")
+        ingest_articles(self.feed, [self.add_article("Second")])
+        self.assertContains(self.client.get("/muffin/"), "Second")
+        # Stored without a bump, only a fresh version can show it
+        self.add_article("Third").save()
+        caches["default"].delete(TIMELINE_VERSION_KEY)
+        self.assertContains(self.client.get("/muffin/"), "Third")
@@ -16,9 +16,11 @@ urlpatterns = [
     path("add_feed/", views.add_feed, name="add_feed"),
     path("find_feeds/", views.find_feeds, name="find_feeds"),
     path("stats/", views.stats, name="stats"),
+    path("search/", views.search, name="search"),
     path("reading_speed/", views.reading_speed, name="reading_speed"),
     path("api/poll_rss/", views.poll_rss, name="poll_rss"),
     path("api/mark_read/", views.mark_read, name="mark_read"),
+    path("api/mark_read_batch/", views.mark_read_batch, name="mark_read_batch"),
     path(
         "api/articles/<int:article_id>/content",
         views.article_content,
@@ -27,4 +29,6 @@ urlpatterns = [
     path("api/follow", views.follow, name="follow"),
     path("api/unfollow", views.unfollow, name="unfollow"),
     path("api/time_wpm", views.time_wpm, name="time_wpm"),
+    path("api/search", views.search_api, name="search_api"),
+    path("api/stats", views.stats_data, name="stats_data"),
 ]
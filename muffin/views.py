@@ -1,59 +1,146 @@
+import json
+from dataclasses import asdict
 from functools import partial, wraps
-from typing import Callable
+from typing import Callable, Optional
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm, UsernameField
-from django.core.exceptions import ValidationError
-from django.core.paginator import Paginator
-from django.http import Http404, HttpResponse, JsonResponse
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
-from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from django.utils.dateparse import parse_datetime
+from django.utils.text import compress_sequence
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import (
+    condition,
+    require_GET,
+    require_http_methods,
+    require_POST,
+)
 
-from .constants import PAGE_SIZE
+from .constants import (
+    ANONYMOUS_INDEX_CACHE_TTL,
+    ANONYMOUS_INDEX_MAX_AGE,
+    ARTICLE_ROW_CACHE_TTL,
+    AVERAGE_WPM,
+    PAGE_CACHE_ALIAS,
+    POLL_TRIGGER_MAX_DURATION,
+    READ_BATCH_MAX_AGE,
+    READ_BATCH_MAX_SIZE,
+    STATS_WINDOW_CHOICES,
+)
 from .controllers import (
+    FeedPoller,
     UserdataFormatter,
+    build_stats_payload,
     construct_feeds_for_website,
-    construct_new_articles,
+    decode_cursor,
+    follow_feed,
+    get_timeline_version,
+    iter_due_feeds,
+    paginate_timeline,
+    prepare_article_rows,
+    record_reads,
+    unfollow_feed,
+    ingest_new_articles,
     get_quote,
-    render_usage_plot,
-    render_favorites_plot,
+    get_stats_etag,
+    search_articles,
+    search_feeds,
 )
-from .models import Article, Feed, ReadEvent
+from .models import Article, Feed, TimelineEntry
 
 
 @require_GET
 def index(request) -> HttpResponse:
-    query = Article.objects.select_related("feed").order_by("-published_date")
     if request.user.is_authenticated:
-        query = query.filter(feed__followers=request.user)
-    paginator = Paginator(query, PAGE_SIZE)
-    page_obj = paginator.get_page(request.GET.get("page"))
+        response = render_index(request)
+        patch_cache_control(response, private=True)
+        return response
+
+    # Everyone logged out sees the same pages, until ingestion or scraping
+    # bumps the version
+    try:
+        cache_key = "anonymous_index:{}:{}:{}".format(
+            get_timeline_version(),
+            cursor_cache_key(request.GET.get("before")),
+            cursor_cache_key(request.GET.get("after")),
+        )
+    except ValueError:
+        raise Http404
+    page_cache = caches[PAGE_CACHE_ALIAS]
+    content = page_cache.get(cache_key)
+    if content is None:
+        response = render_index(request)
+        page_cache.set(cache_key, response.content, ANONYMOUS_INDEX_CACHE_TTL)
+    else:
+        response = HttpResponse(content)
+    patch_cache_control(response, public=True, max_age=ANONYMOUS_INDEX_MAX_AGE)
+    return response
+
+
+def cursor_cache_key(cursor: Optional[str]) -> str:
+    """
+    The decoded cursor, so that only real cursors make cache entries
+    and every spelling of one shares its page. Raises ValueError like decode_cursor.
+    """
+    if cursor is None:
+        return ""
+    published_date, pk = decode_cursor(cursor)
+    return f"{published_date.astimezone(timezone.utc).isoformat()}|{pk}"
+
+
+def render_index(request) -> HttpResponse:
+    before = request.GET.get("before")
+    after = request.GET.get("after")
+    try:
+        if request.user.is_authenticated:
+            query = TimelineEntry.objects.filter(user=request.user).select_related(
+                "article__feed"
+            )
+            page_obj = paginate_timeline(query, before, after, pk_field="article_id")
+            page_obj.object_list = [entry.article for entry in page_obj.object_list]
+        else:
+            query = Article.objects.select_related("feed")
+            page_obj = paginate_timeline(query, before, after)
+    except ValueError:
+        raise Http404
+    prepare_article_rows(page_obj.object_list, request.user)
 
     return render(
         request,
         "muffin/index.html",
-        {"page_obj": page_obj},
+        {
+            "page_obj": page_obj,
+            "wpm": request.user.wpm if request.user.is_authenticated else AVERAGE_WPM,
+            "row_cache_ttl": ARTICLE_ROW_CACHE_TTL,
+        },
     )
 
 
-@require_GET
+@require_POST
 def poll_rss(request) -> HttpResponse:
-    feeds = Feed.objects.all()
-
-    for feed in feeds:
-        new_articles = construct_new_articles(feed)
-        for new_article in new_articles:
-            new_article.save()
-
-        if feed.rss_data["bozo"]:
-            feed.is_bozo = True
-            feed.save()
-
-    return HttpResponse()
+    """
+    Lets staff kick off a short poll by hand.
+    Regular polling is the poll_feeds command's job, not a web worker's.
+    """
+    if not request.user.is_staff:
+        raise PermissionDenied
+    summary = FeedPoller().poll(
+        iter_due_feeds(), max_duration=POLL_TRIGGER_MAX_DURATION
+    )
+    return JsonResponse(asdict(summary))
 
 
 @require_POST
@@ -63,8 +150,35 @@ def mark_read(request) -> HttpResponse:
         article = Article.objects.get(pk=request.POST["article"])
     except (KeyError, Article.DoesNotExist):
         raise Http404
-    read_event = ReadEvent(user=request.user, article=article, read_at=timezone.now())
-    read_event.save()
+    # Reading an article again keeps the first read
+    record_reads(request.user, {article.id: timezone.now()})
+    return HttpResponse()
+
+
+@require_POST
+@login_required
+def mark_read_batch(request) -> HttpResponse:
+    """
+    Takes the reads the page script buffered, as a JSON list of
+    {"article": id, "read_at": ISO 8601 timestamp} in the reads field.
+    Read times older than READ_BATCH_MAX_AGE are pulled up to it.
+    """
+    reads = {}
+    oldest = timezone.now() - READ_BATCH_MAX_AGE
+    try:
+        for read in json.loads(request.POST["reads"])[:READ_BATCH_MAX_SIZE]:
+            read_at = parse_datetime(read["read_at"])
+            if read_at is None or timezone.is_naive(read_at):
+                raise ValueError(f"Bad read time {read['read_at']!r}")
+            read_at = max(read_at, oldest)
+            article_id = int(read["article"])
+            # Past what a database integer holds the id lookup itself would fail
+            if not 0 < article_id < 2**63:
+                raise ValueError(f"Bad article id {article_id}")
+            reads[article_id] = min(read_at, reads.get(article_id, read_at))
+    except (KeyError, TypeError, ValueError):
+        return HttpResponseBadRequest()
+    record_reads(request.user, reads)
     return HttpResponse()
 
 
@@ -116,8 +230,18 @@ def logout_view(request) -> HttpResponse:
 @login_required
 @require_http_methods(["GET", "POST"])
 def download_data(request) -> HttpResponse:
-    formatter = UserdataFormatter(request.user)
-    return JsonResponse(formatter.as_dict())
+    """Streams the export, as a .json.gz download with ?gzip=1"""
+    content = UserdataFormatter(request.user).iter_json()
+    if request.GET.get("gzip"):
+        response = StreamingHttpResponse(
+            compress_sequence(chunk.encode() for chunk in content),
+            content_type="application/gzip",
+        )
+        response["Content-Disposition"] = (
+            'attachment; filename="muffin-userdata.json.gz"'
+        )
+        return response
+    return StreamingHttpResponse(content, content_type="application/json")
 
 
 class ConfirmationForm(forms.Form):
@@ -205,13 +329,12 @@ def sign_up_view(request) -> HttpResponse:
 @login_required
 @require_GET
 def manage_feeds(request) -> HttpResponse:
-    feed_query = Feed.objects.prefetch_related("followers").order_by("title")
+    feed_query = Feed.objects.prefetch_related("followers")
     search_string = request.GET.get("search")
     if search_string:
-        terms = search_string.split()
-        for term in terms:
-            feed_query = feed_query.filter(title__icontains=term)
-    feeds = feed_query.all()
+        feeds = search_feeds(search_string, feed_query)
+    else:
+        feeds = feed_query.order_by("title").all()
     return render(
         request,
         "muffin/manage_feeds.html",
@@ -231,11 +354,9 @@ def add_feed(request) -> HttpResponse:
         feed = Feed.from_url(request.POST["url"])
         if feed is not None:
             feed.save()
-            request.user.followed_feeds.add(feed)
+            follow_feed(request.user, feed)
             request.user.save()
-            new_articles = construct_new_articles(feed)
-            for new_article in new_articles:
-                new_article.save()
+            ingest_new_articles(feed)
             return redirect("muffin:manage_feeds")
     return render(request, "muffin/add_feed_confirmation.html", {"feed": feed})
 
@@ -253,10 +374,8 @@ def find_feeds(request) -> HttpResponse:
                 url = name.removeprefix("url-")
                 feed = Feed.from_url(url)
                 feed.save()
-                request.user.followed_feeds.add(feed)
-                new_articles = construct_new_articles(feed)
-                for new_article in new_articles:
-                    new_article.save()
+                follow_feed(request.user, feed)
+                ingest_new_articles(feed)
         return redirect("muffin:manage_feeds")
 
     return render(
@@ -271,7 +390,7 @@ def find_feeds(request) -> HttpResponse:
 def follow(request) -> HttpResponse:
     feed = get_object_or_404(Feed, pk=request.POST.get("feed"))
     if feed not in request.user.followed_feeds.all():
-        request.user.followed_feeds.add(feed)
+        follow_feed(request.user, feed)
         request.user.save()
     return HttpResponse()
 
@@ -281,31 +400,88 @@ def follow(request) -> HttpResponse:
 def unfollow(request) -> HttpResponse:
     feed = get_object_or_404(Feed, pk=request.POST.get("feed"))
     if feed in request.user.followed_feeds.all():
-        request.user.followed_feeds.remove(feed)
+        unfollow_feed(request.user, feed)
         request.user.save()
     return HttpResponse()
 
 
+def get_stats_window(request) -> Optional[int]:
+    """The ?days= the stats are limited to, None for all of history"""
+    if "days" not in request.GET:
+        return None
+    try:
+        window = int(request.GET["days"])
+    except ValueError:
+        raise Http404
+    # Only the windows the page offers, anything else could reach past year 1
+    if window not in STATS_WINDOW_CHOICES:
+        raise Http404
+    return window
+
+
 @login_required
 @require_GET
 def stats(request) -> HttpResponse:
-    """
-    Load everything into memory.
-    Maybe not the most efficient, but def the easiest.
-    """
-    activity = list(
-        ReadEvent.objects.select_related("article", "article__feed")
-        .filter(user=request.user)
-        .all()
+    """The charts are drawn by the page from stats_data"""
+    return render(
+        request,
+        "muffin/stats.html",
+        {"window": get_stats_window(request), "window_choices": STATS_WINDOW_CHOICES},
     )
-    usage_plot = render_usage_plot(activity)
-    usage_plot_html = usage_plot.to_html(include_plotlyjs=False, full_html=False)
-    favorites_plot = render_favorites_plot(activity)
-    favorites_plot_html = favorites_plot.to_html(
-        include_plotlyjs=False, full_html=False
+
+
+@login_required
+@require_GET
+@condition(
+    etag_func=lambda request: get_stats_etag(request.user, get_stats_window(request))
+)
+def stats_data(request) -> HttpResponse:
+    response = JsonResponse(
+        build_stats_payload(request.user, get_stats_window(request))
     )
+    # Always revalidated, the etag makes that cheap
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@require_GET
+def search(request) -> HttpResponse:
+    search_string = request.GET.get("q", "")
+    feeds = search_feeds(search_string)
+    articles = search_articles(search_string, Article.objects.select_related("feed"))
+    prepare_article_rows(articles, request.user)
     return render(
         request,
-        "muffin/stats.html",
-        {"usage_plot": usage_plot_html, "favorites_plot": favorites_plot_html},
+        "muffin/search.html",
+        {"search_string": search_string, "feeds": feeds, "articles": articles},
+    )
+
+
+@require_GET
+def search_api(request) -> HttpResponse:
+    search_string = request.GET.get("q", "")
+    feeds = search_feeds(search_string)
+    articles = search_articles(search_string)
+    return JsonResponse(
+        {
+            "feeds": [
+                {
+                    "id": feed.id,
+                    "title": feed.title,
+                    "description": feed.description,
+                    "url": feed.url,
+                }
+                for feed in feeds
+            ],
+            "articles": [
+                {
+                    "id": article.id,
+                    "feed": article.feed_id,
+                    "title": article.title,
+                    "url": article.url,
+                    "published_date": article.published_date,
+                }
+                for article in articles
+            ],
+        }
     )